@@ -1,16 +1,102 @@
 import os
+from dataclasses import dataclass
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# API Configuration
-LM_STUDIO_URL = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
-API_HOST = os.getenv("API_HOST", "0.0.0.0")
-API_PORT = int(os.getenv("API_PORT", "8000"))
-
-# Knowledge Base Configuration
-DOCUMENTS_DIR = os.getenv("DOCUMENTS_DIR", "./data/documents")
-VECTORSTORE_DIR = os.getenv("VECTORSTORE_DIR", "./data/vectorstore")
-CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
-CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))
-EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
\ No newline at end of file
+
+@dataclass(frozen=True)
+class Settings:
+    """Environment configuration, read and type-converted once at import."""
+
+    # API Configuration
+    lm_studio_url: str = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
+    lm_studio_timeout: float = float(os.getenv("LM_STUDIO_TIMEOUT", "120"))  # Seconds; generations can be slow
+    lm_studio_connect_timeout: float = float(os.getenv("LM_STUDIO_CONNECT_TIMEOUT", "3"))  # Seconds to establish a connection
+    lm_studio_connect_retries: int = int(os.getenv("LM_STUDIO_CONNECT_RETRIES", "2"))  # Retries of failed connection attempts only
+    # Pooled connections to LM Studio shared by all in-flight requests
+    lm_studio_max_connections: int = int(os.getenv("LM_STUDIO_MAX_CONNECTIONS", "64"))
+    lm_studio_max_keepalive: int = int(os.getenv("LM_STUDIO_MAX_KEEPALIVE", "32"))
+    # Ask LM Studio to reuse the KV cache of a matching prompt prefix (llama.cpp `cache_prompt`)
+    lm_studio_cache_prompt: bool = os.getenv("LM_STUDIO_CACHE_PROMPT", "1") == "1"
+    api_host: str = os.getenv("API_HOST", "0.0.0.0")
+    api_port: int = int(os.getenv("API_PORT", "8000"))
+    # Comma-separated browser origins allowed by CORS; "*" allows any origin
+    cors_allow_origins: str = os.getenv("CORS_ALLOW_ORIGINS", "*")
+
+    # Knowledge Base Configuration
+    documents_dir: str = os.getenv("DOCUMENTS_DIR", "./data/documents")
+    vectorstore_dir: str = os.getenv("VECTORSTORE_DIR", "./data/vectorstore")
+    chunk_size: int = int(os.getenv("CHUNK_SIZE", "1000"))
+    chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "100"))  # Characters repeated between consecutive chunks
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    embedding_device: str = os.getenv("EMBEDDING_DEVICE", "")  # e.g. cuda, mps, cpu; detected when empty
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))  # Texts per model forward pass
+    embedding_threads: int = int(os.getenv("EMBEDDING_THREADS", "0"))  # torch intra-op threads for CPU encoding; 0 keeps torch's default
+    # HNSW index parameters for new Chroma collections (existing ones keep theirs until rebuilt)
+    hnsw_m: int = int(os.getenv("HNSW_M", "32"))
+    hnsw_construction_ef: int = int(os.getenv("HNSW_CONSTRUCTION_EF", "200"))
+    hnsw_search_ef: int = int(os.getenv("HNSW_SEARCH_EF", "64"))
+    # Concurrent query embeddings arriving within this window share one model call (0 disables)
+    query_batch_window_ms: float = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+    query_embedding_cache_size: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))  # Cached query vectors per tenant
+    query_result_cache_size: int = int(os.getenv("QUERY_RESULT_CACHE_SIZE", "1024"))  # Cached retrieval results per tenant
+    # Seconds a cached retrieval result or vector count is trusted; bounds staleness after another worker writes
+    query_result_cache_ttl: float = float(os.getenv("QUERY_RESULT_CACHE_TTL", "300"))
+    kb_cache_max_tenants: int = int(os.getenv("KB_CACHE_MAX_TENANTS", "256"))  # Open tenant knowledge bases kept in memory
+    upload_concurrency: int = int(os.getenv("UPLOAD_CONCURRENCY", "4"))  # Documents parsed in parallel per batch upload
+    # Worker processes that parse documents during a rebuild (1 parses in-process)
+    parse_workers: int = int(os.getenv("PARSE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+    chroma_batch_size: int = int(os.getenv("CHROMA_BATCH_SIZE", "128"))  # Chunks written per Chroma upsert call
+
+    # Semantic Response Cache Configuration
+    semantic_cache_enabled: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+    semantic_cache_threshold: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    semantic_cache_ttl: int = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+    semantic_cache_max_entries: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+    # Only cache answers generated at or below this (persona-effective) temperature
+    semantic_cache_max_temperature: float = float(os.getenv("SEMANTIC_CACHE_MAX_TEMPERATURE", "0.3"))
+    # Comma-separated personas whose answers are cached whatever their temperature
+    semantic_cache_personas: str = os.getenv("SEMANTIC_CACHE_PERSONAS", "professional,safety_officer")
+
+
+settings = Settings()
+
+# Module-level names kept for existing `from app.config import ...` users
+LM_STUDIO_URL = settings.lm_studio_url
+LM_STUDIO_TIMEOUT = settings.lm_studio_timeout
+LM_STUDIO_CONNECT_TIMEOUT = settings.lm_studio_connect_timeout
+LM_STUDIO_CONNECT_RETRIES = settings.lm_studio_connect_retries
+LM_STUDIO_MAX_CONNECTIONS = settings.lm_studio_max_connections
+LM_STUDIO_MAX_KEEPALIVE = settings.lm_studio_max_keepalive
+LM_STUDIO_CACHE_PROMPT = settings.lm_studio_cache_prompt
+API_HOST = settings.api_host
+API_PORT = settings.api_port
+CORS_ALLOW_ORIGINS = [o.strip() for o in settings.cors_allow_origins.split(",") if o.strip()]
+
+DOCUMENTS_DIR = settings.documents_dir
+VECTORSTORE_DIR = settings.vectorstore_dir
+CHUNK_SIZE = settings.chunk_size
+CHUNK_OVERLAP = settings.chunk_overlap
+EMBEDDING_MODEL = settings.embedding_model
+EMBEDDING_DEVICE = settings.embedding_device
+EMBEDDING_BATCH_SIZE = settings.embedding_batch_size
+EMBEDDING_THREADS = settings.embedding_threads
+HNSW_M = settings.hnsw_m
+HNSW_CONSTRUCTION_EF = settings.hnsw_construction_ef
+HNSW_SEARCH_EF = settings.hnsw_search_ef
+QUERY_BATCH_WINDOW_MS = settings.query_batch_window_ms
+QUERY_EMBEDDING_CACHE_SIZE = settings.query_embedding_cache_size
+QUERY_RESULT_CACHE_SIZE = settings.query_result_cache_size
+QUERY_RESULT_CACHE_TTL = settings.query_result_cache_ttl
+KB_CACHE_MAX_TENANTS = settings.kb_cache_max_tenants
+UPLOAD_CONCURRENCY = settings.upload_concurrency
+PARSE_WORKERS = settings.parse_workers
+CHROMA_BATCH_SIZE = settings.chroma_batch_size
+
+SEMANTIC_CACHE_ENABLED = settings.semantic_cache_enabled
+SEMANTIC_CACHE_THRESHOLD = settings.semantic_cache_threshold
+SEMANTIC_CACHE_TTL = settings.semantic_cache_ttl
+SEMANTIC_CACHE_MAX_ENTRIES = settings.semantic_cache_max_entries
+SEMANTIC_CACHE_MAX_TEMPERATURE = settings.semantic_cache_max_temperature
+SEMANTIC_CACHE_PERSONAS = frozenset(p.strip() for p in settings.semantic_cache_personas.split(",") if p.strip())
@@ -1,10 +1,13 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Body, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
 import logging
 import os
+import orjson
 from typing import List, Optional
-import requests
 
 from app.models import (
     CompletionRequest, 
@@ -13,42 +16,31 @@ from app.models import (
     ChatResponse, 
     ChatMessage,
     DocumentUploadResponse,
+    BatchUploadResponse,
     KnowledgeBaseStatusResponse,
-    WebsiteUploadRequest
+    WebsiteUploadRequest,
+    DebugKnowledgeBatchRequest
 )
-from app.services.llm_service import LLMService
+from app.services.llm_service import LLMService, SSE_DONE, sse_data
 from app.services.knowledge_service import get_knowledge_base
-from app.utils.document_processor import save_uploaded_file, delete_document, list_documents
+from app.services.semantic_cache import SemanticCache
+from app.utils.document_processor import save_uploaded_stream, delete_document, list_documents
 from app.utils.prompt_builder import build_knowledge_prompt, build_regular_chat_prompt
-from app.utils.personas import get_persona
+from app.utils.personas import get_persona_temperature
 from app.utils.web_scraper import scrape_website, WebsiteScrapeForbidden
-from app.config import DOCUMENTS_DIR, LM_STUDIO_URL
-
-# Context size limits to prevent token overflow
-MAX_CONTEXT_CHARS = 2000  # Approximately 500 tokens
-ESTIMATED_CHARS_PER_TOKEN = 4  # Rough estimate
-
-def truncate_contexts(contexts, max_total_chars=MAX_CONTEXT_CHARS):
-    """Limit total context size to fit within token limits"""
-    result = []
-    total_chars = 0
-    
-    for ctx in contexts:
-        # If adding this context would exceed our limit
-        if total_chars + len(ctx) > max_total_chars:
-            # If we have no contexts yet, add a truncated version of this one
-            if not result:
-                truncated = ctx[:max_total_chars]
-                result.append(truncated)
-                logging.info(f"Truncated single context to {len(truncated)} chars")
-            break
-        
-        # Otherwise add the full context
-        result.append(ctx)
-        total_chars += len(ctx)
-        
-    logging.info(f"Reduced contexts from {len(contexts)} to {len(result)} to fit token limit")
-    return result
+from app.utils.cors import StaticCORSMiddleware
+from app.config import (
+    DOCUMENTS_DIR,
+    LM_STUDIO_URL,
+    CHUNK_SIZE,
+    CORS_ALLOW_ORIGINS,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_MAX_TEMPERATURE,
+    SEMANTIC_CACHE_PERSONAS,
+)
 
 # Configure logging
 logging.basicConfig(
@@ -57,59 +49,157 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release pooled LM Studio connections
+    await llm_service.aclose()
+
 app = FastAPI(
     title="Business AI API",
     description="API for business knowledge-enhanced AI using LM Studio",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Enable CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+if CORS_ALLOW_ORIGINS == ["*"]:
+    app.add_middleware(StaticCORSMiddleware)
+else:
+    # Explicit origins: no credentials, only the methods and headers the API uses
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ALLOW_ORIGINS,
+        allow_credentials=False,
+        allow_methods=["GET", "POST", "DELETE"],
+        allow_headers=["content-type", "x-tenant-id"],
+    )
 
 # Initialize tenant-aware LLM service
 llm_service = LLMService()
+response_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=SEMANTIC_CACHE_TTL,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+)
 logger.info("Services initialized (tenant-aware)")
 
+def _cache_embedding(text: str, persona: str, temperature: float, tenant_id: Optional[str], no_cache: bool = False):
+    """Embed text for the response cache, or return None when the request must not be cached."""
+    if not SEMANTIC_CACHE_ENABLED or no_cache or not text:
+        return None
+    # Personas opt in explicitly; any other persona only when it samples near-deterministically
+    if persona not in SEMANTIC_CACHE_PERSONAS and get_persona_temperature(persona, temperature) > SEMANTIC_CACHE_MAX_TEMPERATURE:
+        return None
+    try:
+        return get_knowledge_base(tenant_id).embed_query(text)
+    except Exception as e:
+        logger.warning(f"Semantic cache embedding failed: {e}")
+        return None
+
+# Liveness probes hit this often; serialize the constant body once
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "lm_studio_url": llm_service.base_url})
+
+def _invalidate_knowledge_answers(tenant_id: str):
+    """Forget cached answers built from a tenant's knowledge base after its documents change."""
+    # Cache keys start (endpoint, tenant, persona, use_knowledge_base)
+    removed = response_cache.invalidate(lambda key: key[1] == tenant_id and key[3])
+    if removed:
+        logger.info(f"Dropped {removed} cached knowledge answers for tenant {tenant_id}")
+
 @app.get("/health")
-def health_check():
+async def health_check():
     """Check if the API is running and can connect to LM Studio."""
-    return {"status": "healthy", "lm_studio_url": llm_service.base_url}
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
+
+_HEALTH_HEADERS = (
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(_HEALTH_BYTES)).encode("latin-1")),
+)
+
+class _HealthFastPath:
+    """Answer same-origin GET /health before the middleware stack and router.
+
+    Load balancer probes carry no Origin header, so CORS has nothing to add;
+    browser requests with an Origin still go through the full stack.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["path"] == "/health"
+            and scope["method"] == "GET"
+            and not any(name == b"origin" for name, _ in scope["headers"])
+        ):
+            await send({"type": "http.response.start", "status": 200, "headers": list(_HEALTH_HEADERS)})
+            await send({"type": "http.response.body", "body": _HEALTH_BYTES})
+            return
+        await self.app(scope, receive, send)
+
+# Added last so it is the outermost middleware
+app.add_middleware(_HealthFastPath)
 
 @app.post("/api/completion", response_model=CompletionResponse)
 async def create_completion(request: CompletionRequest, x_tenant_id: Optional[str] = Header(None)):
     """Generate text completion with optional knowledge base context."""
     try:
         tenant_id = request.tenant_id or x_tenant_id
-        response_text, sources = llm_service.generate_completion(
+        persona = request.persona if hasattr(request, 'persona') else "default"
+        cache_key = ("completion", tenant_id or "default", persona, request.use_knowledge_base)
+        cache_vec = await asyncio.to_thread(_cache_embedding, request.prompt, persona, request.temperature, tenant_id, request.no_cache)
+        if cache_vec is not None:
+            cached = response_cache.lookup(cache_key, cache_vec)
+            if cached is not None:
+                return CompletionResponse(text=cached[0], source_documents=cached[1])
+
+        response_text, sources = await llm_service.generate_completion(
             request.prompt,
             max_tokens=request.max_tokens,
             temperature=request.temperature,
             use_knowledge_base=request.use_knowledge_base,
-            persona=request.persona if hasattr(request, 'persona') else "default",
+            persona=persona,
             tenant_id=tenant_id
         )
         
-        # Format source document paths for display
-        formatted_sources = [os.path.basename(source) for source in sources] if sources else None
+        # Knowledge base already returns display names
+        formatted_sources = sources or None
+        if cache_vec is not None:
+            response_cache.store(cache_key, cache_vec, response_text, formatted_sources)
         
         return CompletionResponse(
             text=response_text, 
             source_documents=formatted_sources
         )
     except Exception as e:
-        logging.error(f"Error in completion endpoint: {str(e)}")
+        logger.error(f"Error in completion endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _chat_cache_key(tenant_id: Optional[str], persona: str, use_knowledge_base: bool, messages: List[ChatMessage]) -> tuple:
+    """Response cache scope for a chat; the cached vector only embeds the last user turn,
+    so the rest of the conversation is hashed into the key and follow-ups like
+    "tell me more" only match the same conversation."""
+    last_user = max(i for i, m in enumerate(messages) if m.role == "user")
+    history = [(m.role, m.content) for i, m in enumerate(messages) if i != last_user]
+    digest = hashlib.blake2b(orjson.dumps(history), digest_size=16).hexdigest()
+    return ("chat", tenant_id or "default", persona, use_knowledge_base, digest)
+
+def _nothing_to_answer(messages: List[ChatMessage]) -> bool:
+    """Reject chats without a user turn; True when the latest message is blank and needs no LLM call."""
+    if not any(m.role == "user" for m in messages):
+        raise HTTPException(status_code=400, detail="No user message")
+    return not messages[-1].content.strip()
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def create_chat_completion(request: ChatRequest, x_tenant_id: Optional[str] = Header(None)):
     """Generate chat completion with optional knowledge base context."""
     try:
+        if _nothing_to_answer(request.messages):
+            return ChatResponse(message=ChatMessage(role="assistant", content=""), source_documents=None)
+
         # Extract the last user message for knowledge base query
         last_user_message = next((msg.content for msg in reversed(request.messages) 
                        if msg.role == "user"), "")
@@ -117,12 +207,24 @@ async def create_chat_completion(request: ChatRequest, x_tenant_id: Optional[str
         # Get persona if available (default to "default" if not specified)
         persona = getattr(request, 'persona', "default")
         
-        logging.info(f"Chat request received with use_knowledge_base={request.use_knowledge_base}, persona={persona}")
-        logging.info(f"Last user message: '{last_user_message[:50]}...'")
+        logger.debug(
+            "Chat request received with use_knowledge_base=%s, persona=%s, last user message: '%.50s...'",
+            request.use_knowledge_base, persona, last_user_message
+        )
         
         tenant_id = request.tenant_id or x_tenant_id
+        cache_key = _chat_cache_key(tenant_id, persona, request.use_knowledge_base, request.messages)
+        cache_vec = await asyncio.to_thread(_cache_embedding, last_user_message, persona, request.temperature, tenant_id, request.no_cache)
+        if cache_vec is not None:
+            cached = response_cache.lookup(cache_key, cache_vec)
+            if cached is not None:
+                return ChatResponse(
+                    message=ChatMessage(role="assistant", content=cached[0]),
+                    source_documents=cached[1]
+                )
+
         # Delegate to service (which will choose best path incl. KB+completion fallback)
-        answer_text, sources = llm_service.generate_chat_completion(
+        answer_text, sources = await llm_service.generate_chat_completion(
             request.messages,
             max_tokens=request.max_tokens,
             temperature=request.temperature,
@@ -131,32 +233,142 @@ async def create_chat_completion(request: ChatRequest, x_tenant_id: Optional[str
             tenant_id=tenant_id
         )
 
-        formatted_sources = [os.path.basename(s) for s in sources] if sources else None
+        formatted_sources = sources or None
+        if cache_vec is not None:
+            response_cache.store(cache_key, cache_vec, answer_text, formatted_sources)
         return ChatResponse(
             message=ChatMessage(role="assistant", content=answer_text),
             source_documents=formatted_sources
         )
             
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error in chat endpoint: {str(e)}")
+        logger.error(f"Error in chat endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _sources_event(sources) -> bytes:
+    """Leading SSE event carrying the display names of the source documents."""
+    return b"event: sources\ndata: " + orjson.dumps({'source_documents': sources or None}) + b"\n\n"
+
+def _sse_text(raw: bytes) -> Optional[str]:
+    """Concatenate the generated text of an OpenAI-style SSE stream, or None unless it completed cleanly."""
+    parts = []
+    done = False
+    for line in raw.splitlines():
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            done = True
+            continue
+        try:
+            obj = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return None
+        if "error" in obj:
+            return None
+        choice = (obj.get("choices") or [{}])[0]
+        parts.append(choice.get("text") or (choice.get("delta") or {}).get("content") or "")
+    return "".join(parts) if done else None
+
+async def _cached_chunks(frame):
+    yield sse_data({"choices": [frame]})
+    yield SSE_DONE
+
+def _event_stream(sources, chunks, on_complete=None):
+    async def generate():
+        yield _sources_event(sources)
+        received = bytearray() if on_complete else None
+        async for chunk in chunks:
+            if received is not None:
+                received += chunk
+            yield chunk
+        # Only a fully received stream is worth caching
+        if on_complete:
+            text = _sse_text(bytes(received))
+            if text:
+                on_complete(text)
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+@app.post("/api/completion/stream")
+async def stream_completion(request: CompletionRequest, x_tenant_id: Optional[str] = Header(None)):
+    """Stream a text completion as server-sent events, preceded by a `sources` event."""
+    try:
+        tenant_id = request.tenant_id or x_tenant_id
+        cache_key = ("completion", tenant_id or "default", request.persona, request.use_knowledge_base)
+        cache_vec = await asyncio.to_thread(_cache_embedding, request.prompt, request.persona, request.temperature, tenant_id, request.no_cache)
+        if cache_vec is not None:
+            cached = response_cache.lookup(cache_key, cache_vec)
+            if cached is not None:
+                return _event_stream(cached[1], _cached_chunks({"text": cached[0]}))
+
+        sources, chunks = await llm_service.stream_completion(
+            request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            use_knowledge_base=request.use_knowledge_base,
+            persona=request.persona,
+            tenant_id=tenant_id
+        )
+        on_complete = None
+        if cache_vec is not None:
+            on_complete = lambda text: response_cache.store(cache_key, cache_vec, text, sources or None)
+        return _event_stream(sources, chunks, on_complete)
+    except Exception as e:
+        logger.error(f"Error in streaming completion endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/chat/stream")
+async def stream_chat_completion(request: ChatRequest, x_tenant_id: Optional[str] = Header(None)):
+    """Stream a chat answer as server-sent events, preceded by a `sources` event."""
+    try:
+        if _nothing_to_answer(request.messages):
+            return _event_stream(None, _cached_chunks({"delta": {"content": ""}}))
+
+        tenant_id = request.tenant_id or x_tenant_id
+        last_user_message = next((m.content for m in reversed(request.messages) if m.role == "user"), "")
+        cache_key = _chat_cache_key(tenant_id, request.persona, request.use_knowledge_base, request.messages)
+        cache_vec = await asyncio.to_thread(_cache_embedding, last_user_message, request.persona, request.temperature, tenant_id, request.no_cache)
+        if cache_vec is not None:
+            cached = response_cache.lookup(cache_key, cache_vec)
+            if cached is not None:
+                # Mirror the live stream: knowledge answers arrive as text frames, plain chat as deltas
+                frame = {"text": cached[0]} if cached[1] else {"delta": {"content": cached[0]}}
+                return _event_stream(cached[1], _cached_chunks(frame))
+
+        sources, chunks = await llm_service.stream_chat_completion(
+            request.messages,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            use_knowledge_base=request.use_knowledge_base,
+            persona=request.persona,
+            tenant_id=tenant_id
+        )
+        on_complete = None
+        if cache_vec is not None:
+            on_complete = lambda text: response_cache.store(cache_key, cache_vec, text, sources or None)
+        return _event_stream(sources, chunks, on_complete)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in streaming chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/knowledge/upload", response_model=DocumentUploadResponse)
 async def upload_document(file: UploadFile = File(...), tenant_id: Optional[str] = Form(None), x_tenant_id: Optional[str] = Header(None)):
     """Upload a document to the knowledge base."""
     try:
-        # Read file content
-        file_content = await file.read()
-
-        # Save the file
+        # Stream the upload to disk without buffering it in memory
         tid = tenant_id or x_tenant_id or "default"
         docs_dir = os.path.join(DOCUMENTS_DIR, tid)
-        file_path = save_uploaded_file(file_content, file.filename, docs_dir)
+        file_path = await asyncio.to_thread(save_uploaded_stream, file.file, file.filename, docs_dir)
 
         # Add to tenant knowledge base
-        kb = get_knowledge_base(tid)
         logger.info(f"Adding document to knowledge base (tenant={tid}): {file.filename}")
-        success = kb.add_document(file_path)
+        kb = await asyncio.to_thread(get_knowledge_base, tid)
+        success = await asyncio.to_thread(kb.add_document, file_path)
+        _invalidate_knowledge_answers(tid)
         
         if success:
             logger.info(f"Document successfully added: {file.filename}")
@@ -175,7 +387,58 @@ async def upload_document(file: UploadFile = File(...), tenant_id: Optional[str]
                 tenant_id=tid
             )
     except Exception as e:
-        logging.error(f"Error uploading document: {str(e)}")
+        logger.error(f"Error uploading document: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/knowledge/upload/batch", response_model=BatchUploadResponse)
+async def upload_documents_batch(files: List[UploadFile] = File(...), tenant_id: Optional[str] = Form(None), x_tenant_id: Optional[str] = Header(None)):
+    """Upload several documents at once, processing them concurrently."""
+    try:
+        tid = tenant_id or x_tenant_id or "default"
+        docs_dir = os.path.join(DOCUMENTS_DIR, tid)
+        kb = await asyncio.to_thread(get_knowledge_base, tid)
+
+        # Chunk ids derive from the filename, so a repeated name would collide in Chroma
+        # and fail the whole batch; only its first occurrence is indexed
+        unique = {}
+        for f in files:
+            unique.setdefault(f.filename, f)
+
+        file_paths = await asyncio.gather(*(
+            asyncio.to_thread(save_uploaded_stream, f.file, f.filename, docs_dir)
+            for f in unique.values()
+        ))
+
+        # One call parses files in parallel and embeds all chunks as a single batch
+        logger.info(f"Adding {len(file_paths)} documents to knowledge base (tenant={tid})")
+        added = await asyncio.to_thread(kb.add_documents, file_paths)
+        _invalidate_knowledge_answers(tid)
+        processed = {f.filename: added.get(p, False) for f, p in zip(unique.values(), file_paths)}
+
+        results = []
+        for f in files:
+            if unique[f.filename] is not f:
+                results.append(DocumentUploadResponse(
+                    status="error",
+                    filename=f.filename,
+                    message="Duplicate filename in batch; file was not saved",
+                    tenant_id=tid
+                ))
+                continue
+            ok = processed[f.filename]
+            results.append(DocumentUploadResponse(
+                status="success" if ok else "warning",
+                filename=f.filename,
+                message="Document uploaded and processed successfully" if ok else "Document saved but could not be processed",
+                tenant_id=tid
+            ))
+        return BatchUploadResponse(
+            status="success" if all(r.status == "success" for r in results) else "warning",
+            results=results,
+            tenant_id=tid
+        )
+    except Exception as e:
+        logger.error(f"Error uploading documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/knowledge/add-website", response_model=DocumentUploadResponse)
@@ -186,15 +449,16 @@ async def add_website(request: WebsiteUploadRequest, tenant_id: Optional[str] =
         logger.info(f"Scraping website: {url}")
         tid = request.tenant_id or tenant_id or x_tenant_id or "default"
         docs_dir = os.path.join(DOCUMENTS_DIR, tid)
-        file_path = scrape_website(url, docs_dir)
+        file_path = await asyncio.to_thread(scrape_website, url, docs_dir)
         
         if not file_path:
             raise HTTPException(status_code=400, detail="Failed to scrape website")
         # Add to knowledge base
         filename = os.path.basename(file_path)
         logger.info(f"Adding scraped content to knowledge base: {filename}")
-        kb = get_knowledge_base(tid)
-        success = kb.add_document(file_path)
+        kb = await asyncio.to_thread(get_knowledge_base, tid)
+        success = await asyncio.to_thread(kb.add_document, file_path)
+        _invalidate_knowledge_answers(tid)
         
         if success:
             logger.info(f"Website content successfully added: {filename}")
@@ -213,13 +477,13 @@ async def add_website(request: WebsiteUploadRequest, tenant_id: Optional[str] =
                 tenant_id=tid
             )
     except WebsiteScrapeForbidden as fe:
-        logging.warning(f"Forbidden scraping website: {str(fe)}")
+        logger.warning(f"Forbidden scraping website: {str(fe)}")
         raise HTTPException(status_code=400, detail=str(fe))
     except HTTPException:
         # Already a proper HTTP error, propagate
         raise
     except Exception as e:
-        logging.error(f"Error adding website: {str(e)}")
+        logger.error(f"Error adding website: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/knowledge/documents/{filename}")
@@ -228,29 +492,34 @@ async def remove_document(filename: str, tenant_id: Optional[str] = Query(None),
     try:
         tid = tenant_id or x_tenant_id or "default"
         docs_dir = os.path.join(DOCUMENTS_DIR, tid)
-        success = delete_document(filename, docs_dir)
+        success = await asyncio.to_thread(delete_document, filename, docs_dir)
         
         if success:
-            # Rebuild the knowledge base
-            logger.info(f"Document deleted, rebuilding knowledge base: {filename}")
-            kb = get_knowledge_base(tid)
-            kb.rebuild_knowledge_base()
+            # Drop only this document's vectors; other documents are untouched
+            logger.info(f"Document deleted, removing its vectors from knowledge base: {filename}")
+            kb = await asyncio.to_thread(get_knowledge_base, tid)
+            if not await asyncio.to_thread(kb.remove_document, os.path.join(docs_dir, filename)):
+                logger.warning(f"Vector removal failed, rebuilding knowledge base: {filename}")
+                await asyncio.to_thread(kb.rebuild_knowledge_base)
+            _invalidate_knowledge_answers(tid)
             
             return {"status": "success", "message": f"Document {filename} removed successfully"}
         else:
             raise HTTPException(status_code=404, detail=f"Document {filename} not found")
     except Exception as e:
-        logging.error(f"Error removing document: {str(e)}")
+        logger.error(f"Error removing document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/knowledge/rebuild")
-async def rebuild_knowledge_base(tenant_id: Optional[str] = Query(None), x_tenant_id: Optional[str] = Header(None)):
-    """Rebuild the entire knowledge base from documents."""
+async def rebuild_knowledge_base(tenant_id: Optional[str] = Query(None), x_tenant_id: Optional[str] = Header(None),
+                                 full: bool = Query(False)):
+    """Sync the knowledge base with the documents directory, or recreate it from scratch with `full=true`."""
     try:
         logger.info("Rebuilding knowledge base")
         tid = tenant_id or x_tenant_id or "default"
-        kb = get_knowledge_base(tid)
-        success = kb.rebuild_knowledge_base()
+        kb = await asyncio.to_thread(get_knowledge_base, tid)
+        success = await asyncio.to_thread(kb.rebuild_knowledge_base, full)
+        _invalidate_knowledge_answers(tid)
         
         if success:
             logger.info("Knowledge base rebuilt successfully")
@@ -259,7 +528,7 @@ async def rebuild_knowledge_base(tenant_id: Optional[str] = Query(None), x_tenan
             logger.warning("Knowledge base rebuilt with warnings")
             return {"status": "warning", "message": "Knowledge base rebuilt with warnings"}
     except Exception as e:
-        logging.error(f"Error rebuilding knowledge base: {str(e)}")
+        logger.error(f"Error rebuilding knowledge base: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/knowledge/status", response_model=KnowledgeBaseStatusResponse)
@@ -267,8 +536,8 @@ async def get_knowledge_base_status(tenant_id: Optional[str] = Query(None), x_te
     """Get status of the knowledge base."""
     try:
         tid = tenant_id or x_tenant_id or "default"
-        kb = get_knowledge_base(tid)
-        status = kb.get_status()
+        kb = await asyncio.to_thread(get_knowledge_base, tid)
+        status = await asyncio.to_thread(kb.get_status)
         logger.info(f"Knowledge base status: {status['document_count']} documents, {status['vector_count']} vectors")
         
         return KnowledgeBaseStatusResponse(
@@ -279,20 +548,45 @@ async def get_knowledge_base_status(tenant_id: Optional[str] = Query(None), x_te
             tenant_id=tid
         )
     except Exception as e:
-        logging.error(f"Error getting knowledge base status: {str(e)}")
+        logger.error(f"Error getting knowledge base status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/debug/cache")
+def debug_cache():
+    """Semantic response cache counters."""
+    return response_cache.stats()
+
+def _debug_match(query: str, contexts: List[str], sources: List[str]) -> dict:
+    return {
+        "query": query,
+        "found_matches": len(contexts) > 0,
+        "contexts": [c[:CHUNK_SIZE] for c in contexts],
+        "sources": sources,
+    }
+
 @app.get("/debug/knowledge")
 async def debug_knowledge(query: str, tenant_id: Optional[str] = Query(None), x_tenant_id: Optional[str] = Header(None)):
     """Debug endpoint to directly test knowledge retrieval."""
     tid = tenant_id or x_tenant_id or "default"
-    kb = get_knowledge_base(tid)
-    contexts, sources = kb.query(query)
+    kb = await asyncio.to_thread(get_knowledge_base, tid)
+    contexts, sources = await kb.aquery(query)
     
     return {
-        "query": query,
-        "found_matches": len(contexts) > 0,
-        "contexts": contexts,
-    "sources": sources,
-    "tenant_id": tid
+        **_debug_match(query, contexts, sources),
+        "tenant_id": tid,
+        "embedding_cache": kb.query_embedding_cache_info()
+    }
+
+@app.post("/debug/knowledge/batch")
+async def debug_knowledge_batch(request: DebugKnowledgeBatchRequest, x_tenant_id: Optional[str] = Header(None)):
+    """Run several retrieval debug queries in one request."""
+    tid = request.tenant_id or x_tenant_id or "default"
+    kb = await asyncio.to_thread(get_knowledge_base, tid)
+    # Queried concurrently, so the embedding and search micro-batchers can combine them
+    answers = await asyncio.gather(*(kb.aquery(q) for q in request.queries))
+    
+    return {
+        "results": [_debug_match(q, contexts, sources) for q, (contexts, sources) in zip(request.queries, answers)],
+        "tenant_id": tid,
+        "embedding_cache": kb.query_embedding_cache_info()
     }
\ No newline at end of file
@@ -8,6 +8,7 @@ class CompletionRequest(BaseModel):
     use_knowledge_base: Optional[bool] = True
     persona: Optional[str] = "default"  # Added persona field
     tenant_id: Optional[str] = None  # Multi-tenant support
+    no_cache: bool = False  # Skip the semantic response cache (lookup and store)
     
 class CompletionResponse(BaseModel):
     text: str
@@ -24,6 +25,7 @@ class ChatRequest(BaseModel):
     use_knowledge_base: Optional[bool] = True
     persona: Optional[str] = "default"  # Added persona field
     tenant_id: Optional[str] = None  # Multi-tenant support
+    no_cache: bool = False  # Skip the semantic response cache (lookup and store)
     
 class ChatResponse(BaseModel):
     message: ChatMessage
@@ -35,9 +37,18 @@ class DocumentUploadResponse(BaseModel):
     message: str
     tenant_id: Optional[str] = None
 
+class BatchUploadResponse(BaseModel):
+    status: str
+    results: List[DocumentUploadResponse]
+    tenant_id: Optional[str] = None
+
 class WebsiteUploadRequest(BaseModel):
     url: str
     tenant_id: Optional[str] = None
+
+class DebugKnowledgeBatchRequest(BaseModel):
+    queries: List[str]
+    tenant_id: Optional[str] = None
     
 class KnowledgeBaseStatusResponse(BaseModel):
     status: str
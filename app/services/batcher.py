@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Any, Callable, List, Sequence
+
+
+class _Slot:
+    __slots__ = ("item", "result", "error", "done")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-item calls from worker threads into one batched call.
+
+    The first caller to arrive waits ``window_seconds`` for others to join,
+    then runs ``batch_fn`` once over everything queued (in groups of at most
+    ``max_batch``) and hands each caller its own result. With a zero window
+    calls go straight through.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]], window_seconds: float = 0.005, max_batch: int = 32):
+        self.batch_fn = batch_fn
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending: List[_Slot] = []
+        self._collecting = False
+
+    def submit(self, item: Any) -> Any:
+        if self.window_seconds <= 0:
+            return self.batch_fn([item])[0]
+
+        slot = _Slot(item)
+        with self._lock:
+            self._pending.append(slot)
+            leader = not self._collecting
+            self._collecting = True
+
+        if leader:
+            time.sleep(self.window_seconds)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._collecting = False
+            for start in range(0, len(batch), self.max_batch):
+                self._run(batch[start:start + self.max_batch])
+
+        slot.done.wait()
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _run(self, group: List[_Slot]) -> None:
+        try:
+            results = self.batch_fn([s.item for s in group])
+            if len(results) != len(group):
+                raise ValueError(f"Batch function returned {len(results)} results for {len(group)} items")
+            for s, result in zip(group, results):
+                s.result = result
+        except Exception as e:
+            for s in group:
+                s.error = e
+        finally:
+            for s in group:
+                s.done.set()
@@ -5,24 +5,126 @@ from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 # from sentence_transformers import SentenceTransformer  # Removed to avoid heavy import at startup
 import chromadb
-# Lazy import of embedding_functions only when needed to avoid heavy deps during FAST_START
-embedding_functions = None
-import pypdf
-import docx2txt
 import hashlib
-import math
+import sys
+import numpy as np
+import threading
+import time
+import asyncio
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 
 # Optional fast-start mode to skip heavy model download (set FAST_START=1)
 FAST_START = os.getenv("FAST_START", "0") == "1"
 
-from app.config import DOCUMENTS_DIR, VECTORSTORE_DIR, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL
-from app.utils.document_processor import list_documents
+from app.config import DOCUMENTS_DIR, VECTORSTORE_DIR, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS, UPLOAD_CONCURRENCY, CHROMA_BATCH_SIZE, PARSE_WORKERS
+from app.config import KB_CACHE_MAX_TENANTS, QUERY_EMBEDDING_CACHE_SIZE, QUERY_RESULT_CACHE_SIZE, QUERY_RESULT_CACHE_TTL, QUERY_BATCH_WINDOW_MS, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF
+from app.utils.document_processor import list_documents, extract_text, chunk_text, parse_and_chunk, CHUNKER_VERSION
+from app.utils.embedding_cache import EmbeddingCache, file_digest
+from app.services.batcher import MicroBatcher
 
-# Cache for tenant-specific knowledge bases
-_kb_cache: Dict[str, "KnowledgeBase"] = {}
+# Cache for tenant-specific knowledge bases, least recently used first
+_kb_cache: "OrderedDict[str, KnowledgeBase]" = OrderedDict()
+# Knowledge bases are resolved from worker threads; construct each tenant once
+_kb_cache_lock = threading.Lock()
 
 MIGRATION_FLAG_FILE = ".multitenant_migrated"
 
+# Deterministic (non-semantic) fallback embedding: SHA-256 bytes repeated to
+# HASH_EMBEDDING_DIM, mapped from [0, 255] to [-1, 1] and L2-normalized
+HASH_EMBEDDING_DIM = 384
+_HASH_REPEATS = -(-HASH_EMBEDDING_DIM // hashlib.sha256().digest_size)
+SCALE = np.float32(2.0 / 255.0)
+SHIFT = np.float32(-1.0)
+
+def _hash_embed(texts: List[str]) -> List[List[float]]:
+    if not texts:
+        return []
+    buf = b"".join(
+        (hashlib.sha256(t.encode('utf-8')).digest() * _HASH_REPEATS)[:HASH_EMBEDDING_DIM] for t in texts
+    )
+    vectors = np.frombuffer(buf, dtype=np.uint8).reshape(len(texts), HASH_EMBEDDING_DIM).astype(np.float32)
+    vectors *= SCALE
+    vectors += SHIFT
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors.tolist()
+
+class HashEmbeddingFunction:
+    """Lightweight Chroma embedding function fallback.
+
+    Conforms to interface: __call__(self, input: List[str]) -> List[List[float]]
+    """
+    def __call__(self, input):  # Chroma expects parameter name 'input'
+        return _hash_embed(input)
+
+def _embedding_device() -> str:
+    """EMBEDDING_DEVICE if set, otherwise the best available torch device."""
+    if EMBEDDING_DEVICE:
+        return EMBEDDING_DEVICE
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return "cuda"
+        if torch.backends.mps.is_available():
+            return "mps"
+    except Exception:
+        pass
+    return "cpu"
+
+class SentenceTransformerEmbeddingFunction:
+    """Chroma embedding function for a sentence-transformers model on an explicit device.
+
+    Like chromadb's own SentenceTransformerEmbeddingFunction, but encodes with
+    ``batch_size`` so large ingests keep an accelerator busy.
+    """
+    def __init__(self, model_name: str, device: str, batch_size: int = EMBEDDING_BATCH_SIZE):
+        # Imported here to avoid the heavy dependency during FAST_START
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name, device=device)
+        self.batch_size = batch_size
+
+    def __call__(self, input):  # Chroma expects parameter name 'input'
+        return self._model.encode(list(input), batch_size=self.batch_size, convert_to_numpy=True).tolist()
+
+# Embedding functions by model name, with the label recorded in the embedding cache signature
+_embedding_fn_cache: Dict[str, Tuple[Any, str]] = {}
+_embedding_fn_lock = threading.Lock()
+
+def _create_embedding_fn(embedding_model: str) -> Tuple[Any, str]:
+    logger = logging.getLogger(__name__)
+    if FAST_START:
+        logger.warning("FAST_START enabled: using lightweight hash embedding function (not semantic)")
+    else:
+        try:
+            device = _embedding_device()
+            if EMBEDDING_THREADS > 0:
+                # Process-wide; the model is created once under _embedding_fn_lock
+                import torch
+                torch.set_num_threads(EMBEDDING_THREADS)
+            logger.info(f"Loading embedding model '{embedding_model}' on {device}")
+            return SentenceTransformerEmbeddingFunction(embedding_model, device), embedding_model
+        except Exception as e:
+            logger.error(f"Failed loading sentence transformer model '{embedding_model}': {e}. Falling back to hash embeddings.")
+
+    logger.warning(
+        "Using non-semantic hash embeddings; enable real model by unsetting FAST_START and ensuring model download works."
+    )
+    return HashEmbeddingFunction(), f"hash-{HASH_EMBEDDING_DIM}"
+
+def _get_or_create_embedding_fn(embedding_model: str) -> Tuple[Any, str]:
+    """Return the process-wide embedding function for a model and its label, loading it on first use."""
+    cached = _embedding_fn_cache.get(embedding_model)
+    if cached is None:
+        with _embedding_fn_lock:
+            cached = _embedding_fn_cache.get(embedding_model)
+            if cached is None:
+                cached = _embedding_fn_cache[embedding_model] = _create_embedding_fn(embedding_model)
+    return cached
+
 def _ensure_default_migration():
     """One-time migration: move flat documents/vectorstore into default/ subdirectories if not yet migrated."""
     root_docs = Path(DOCUMENTS_DIR)
@@ -85,82 +187,60 @@ class KnowledgeBase:
         os.makedirs(self.documents_dir, exist_ok=True)
         os.makedirs(self.vectorstore_dir, exist_ok=True)
 
-        # Embeddings & client (with fallback hash embedding for fast start or import issues)
-        self.embedding_function = None
-        if FAST_START:
-            self.logger.warning("FAST_START enabled: using lightweight hash embedding function (not semantic)")
-        try:
-            if not FAST_START:
-                global embedding_functions
-                if embedding_functions is None:
-                    from chromadb.utils import embedding_functions as ef  # type: ignore
-                    embedding_functions = ef
-                self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-                    model_name=embedding_model
-                )
-        except Exception as e:
-            self.logger.error(f"Failed loading sentence transformer model '{embedding_model}': {e}. Falling back to hash embeddings.")
-
-        if self.embedding_function is None:
-            # Define simple deterministic hash embedding of fixed dim 384
-            dim = 384
-
-            def _hash_embed(texts):
-                vectors = []
-                for t in texts:
-                    h = hashlib.sha256(t.encode('utf-8')).digest()
-                    nums = []
-                    while len(nums) < dim:
-                        for b in h:
-                            nums.append((b / 255.0) * 2 - 1)
-                            if len(nums) >= dim:
-                                break
-                    norm = math.sqrt(sum(x * x for x in nums)) or 1.0
-                    vectors.append([x / norm for x in nums])
-                return vectors
-
-            class HashEmbeddingFunction:
-                """Lightweight Chroma embedding function fallback.
-
-                Conforms to interface: __call__(self, input: List[str]) -> List[List[float]]
-                """
-                def __call__(self, input):  # Chroma expects parameter name 'input'
-                    return _hash_embed(input)
-
-            self.embedding_function = HashEmbeddingFunction()
-            self.logger.warning(
-                "Using non-semantic hash embeddings; enable real model by unsetting FAST_START and ensuring model download works."
-            )
+        # Embeddings & client (with fallback hash embedding for fast start or import issues);
+        # the model is loaded once per process and shared by every tenant
+        self.embedding_function, embedding_label = _get_or_create_embedding_fn(embedding_model)
         self.client = chromadb.PersistentClient(path=self.vectorstore_dir)
+        # Embeddings of unchanged files are reused across rebuilds and restarts
+        self.embedding_cache = EmbeddingCache(os.path.join(self.vectorstore_dir, "embeddings.sqlite3"))
+        self._embedding_signature = f"{embedding_label}|{chunk_size}|{chunk_overlap}|v{CHUNKER_VERSION}"
 
         self.collection_name = f"business_knowledge_{self.tenant_id}"
         self.collection = None
+        # Documents may be parsed concurrently, but Chroma writes are serialized
+        self._write_lock = threading.Lock()
+        # Distinct questions arriving together share one embedding call;
+        # repeated questions skip the embedding model entirely
+        self._query_batcher = MicroBatcher(self.embedding_function, window_seconds=QUERY_BATCH_WINDOW_MS / 1000)
+        self._embed_query_cached = lru_cache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)(self._embed_query)
+        # Likewise, concurrent searches share one collection query
+        self._search_batcher = MicroBatcher(self._search_many, window_seconds=QUERY_BATCH_WINDOW_MS / 1000)
+        # (stored_at, documents, sources) for repeated questions, valid until the next write here
+        # or QUERY_RESULT_CACHE_TTL, whichever comes first (other workers may write too)
+        self._results: "OrderedDict[Tuple[str, int], Tuple[float, List[str], List[str]]]" = OrderedDict()
+        self._results_lock = threading.Lock()
+        self._generation = 0
+        # (generation, first chunk) returned when a search finds nothing
+        self._fallback: Tuple[int, Optional[Tuple[str, str]]] = (-1, None)
+        # (generation, stored chunk count, counted_at) so chat turns don't count the collection
+        self._count: Tuple[int, int, float] = (-1, 0, 0.0)
         self._ensure_collection()
 
+    def _collection_metadata(self) -> Dict[str, Any]:
+        """Collection metadata, including the HNSW index parameters Chroma builds with."""
+        return {
+            "tenant": self.tenant_id,
+            # Embeddings are unit length, so cosine distance ranks like inner product
+            "hnsw:space": "cosine",
+            "hnsw:M": HNSW_M,
+            "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+            "hnsw:search_ef": HNSW_SEARCH_EF,
+        }
+
     def _ensure_collection(self):
         """Idempotently get or create the Chroma collection."""
         if self.collection is not None:
             return
         try:
-            # Preferred helper if available
-            if hasattr(self.client, 'get_or_create_collection'):
-                self.collection = self.client.get_or_create_collection(
+            # Not get_or_create_collection: it would overwrite the metadata of an
+            # existing collection, which records the HNSW parameters it was built with
+            try:
+                self.collection = self.client.get_collection(
                     name=self.collection_name,
-                    embedding_function=self.embedding_function,
-                    metadata={"tenant": self.tenant_id}
+                    embedding_function=self.embedding_function
                 )
-            else:
-                try:
-                    self.collection = self.client.get_collection(
-                        name=self.collection_name,
-                        embedding_function=self.embedding_function
-                    )
-                except ValueError:
-                    self.collection = self.client.create_collection(
-                        name=self.collection_name,
-                        embedding_function=self.embedding_function,
-                        metadata={"tenant": self.tenant_id}
-                    )
+            except ValueError:
+                self._create_collection()
             self.logger.info(
                 f"Collection ready '{self.collection_name}' (count={self.collection.count()})"
             )
@@ -168,164 +248,395 @@ class KnowledgeBase:
             self.logger.error(f"Failed to ensure collection {self.collection_name}: {e}")
             raise
     
+    def _create_collection(self):
+        self.collection = self.client.create_collection(
+            name=self.collection_name,
+            embedding_function=self.embedding_function,
+            metadata=self._collection_metadata()
+        )
+
+    def _reset_collection(self):
+        """Delete then recreate the collection."""
+        try:
+            self.client.delete_collection(self.collection_name)
+            self.logger.info(f"Deleted existing collection {self.collection_name}")
+        except ValueError:
+            self.logger.info("No existing collection to delete for rebuild")
+        self._create_collection()
+        self._collection_changed()
+
+    def _collection_changed(self):
+        """Drop cached retrieval results; called after every collection write."""
+        with self._results_lock:
+            self._generation += 1
+            self._results.clear()
+
     def _extract_text_from_file(self, file_path: str) -> Optional[str]:
         """Extract text from various file types."""
-        try:
-            ext = os.path.splitext(file_path)[1].lower()
-            
-            if ext == '.txt':
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            
-            elif ext == '.pdf':
-                text = ""
-                with open(file_path, 'rb') as f:
-                    pdf = pypdf.PdfReader(f)
-                    for page in pdf.pages:
-                        text += page.extract_text() + "\n"
-                return text
-            
-            elif ext == '.docx':
-                return docx2txt.process(file_path)
-            
-            else:
-                self.logger.warning(f"Unsupported file type: {ext}")
-                return None
-        
-        except Exception as e:
-            self.logger.error(f"Error extracting text from {file_path}: {str(e)}")
-            return None
+        return extract_text(file_path)
     
     def _chunk_text(self, text: str, source: str) -> List[Dict[str, Any]]:
         """Split text into chunks with overlap."""
-        chunks = []
-        
-        # Simple chunk by paragraph then by size
-        paragraphs = text.split('\n\n')
-        
-        current_chunk = ""
-        chunk_id = 0
-        
-        for paragraph in paragraphs:
-            # Clean paragraph
-            paragraph = paragraph.strip()
-            if not paragraph:
-                continue
-                
-            if len(current_chunk) + len(paragraph) <= self.chunk_size:
-                current_chunk += paragraph + "\n\n"
-            else:
-                if current_chunk:
-                    chunks.append({
-                        "id": f"{os.path.basename(source)}-{chunk_id}",
-                        "text": current_chunk.strip(), 
-                        "source": source
-                    })
-                    chunk_id += 1
-                    
-                    # Create overlap by keeping some content
-                    words = current_chunk.split()
-                    if len(words) > self.chunk_overlap:
-                        current_chunk = " ".join(words[-self.chunk_overlap:]) + "\n\n"
-                    else:
-                        current_chunk = ""
-                
-                current_chunk += paragraph + "\n\n"
-        
-        # Add the last chunk
-        if current_chunk:
-            chunks.append({
-                "id": f"{os.path.basename(source)}-{chunk_id}",
-                "text": current_chunk.strip(), 
-                "source": source
-            })
-        
-        self.logger.info(f"Split document into {len(chunks)} chunks")
-        return chunks
+        return chunk_text(text, source, self.chunk_size, self.chunk_overlap)
     
+    def _load_chunks(self, file_path: str) -> List[Dict[str, Any]]:
+        """Extract and chunk a document, returning no chunks on failure."""
+        return parse_and_chunk(file_path, self.chunk_size, self.chunk_overlap)
+
+    def _load_cached(self, file_path: str, parse: bool = True) -> Tuple[Optional[str], Optional[List[Dict[str, Any]]], Optional[np.ndarray]]:
+        """Chunk a document, reusing cached chunks and vectors when its content is unchanged.
+
+        With ``parse=False`` a cache miss is returned with chunks set to None
+        so the caller can parse it elsewhere.
+
+        Returns:
+            Tuple of (content_hash, chunks, vectors); vectors is None when the chunks still need embedding
+        """
+        try:
+            key = file_digest(file_path, self._embedding_signature)
+            cached = self.embedding_cache.get(key)
+        except Exception as e:
+            self.logger.warning(f"Embedding cache unavailable for {file_path}: {e}")
+            key, cached = None, None
+
+        if cached is None:
+            return key, self._load_chunks(file_path) if parse else None, None
+
+        texts, vectors = cached
+        base = os.path.basename(file_path)
+        chunks = [
+            {"id": f"{base}-{i}", "text": text, "source": file_path}
+            for i, text in enumerate(texts)
+        ]
+        self.logger.info(f"Reusing {len(chunks)} cached embeddings for {file_path}")
+        return key, chunks, vectors
+
+    def _add_chunks(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray, batch_size: int = CHROMA_BATCH_SIZE) -> None:
+        """Upsert embedded chunks with one collection write per ``batch_size`` chunks."""
+        # Prepare data for Chroma
+        ids = [chunk["id"] for chunk in chunks]
+        texts = [chunk["text"] for chunk in chunks]
+        # Store the display name once at ingest so queries needn't parse paths;
+        # computed once per document and shared by all of its chunks
+        names = {source: sys.intern(os.path.basename(source)) for source in {chunk["source"] for chunk in chunks}}
+        metadatas = [{"source": chunk["source"], "name": names[chunk["source"]]} for chunk in chunks]
+        for chunk, metadata in zip(chunks, metadatas):
+            if chunk.get("hash"):
+                metadata["hash"] = chunk["hash"]
+
+        # Upsert so existing ids are updated in place rather than deleted and
+        # re-inserted; each write is one SQLite transaction, so write in
+        # fixed-size batches rather than per document or all at once
+        step = max(1, batch_size)
+        try:
+            with self._write_lock:
+                for start in range(0, len(ids), step):
+                    end = start + step
+                    self.collection.upsert(
+                        ids=ids[start:end],
+                        embeddings=embeddings[start:end].tolist(),
+                        documents=texts[start:end],
+                        metadatas=metadatas[start:end]
+                    )
+        finally:
+            # Earlier batches may have landed even when a later one failed
+            self._collection_changed()
+
+    def _is_stored(self, key: str, chunks: List[Dict[str, Any]]) -> bool:
+        """Whether the collection already holds exactly these chunks of this file content."""
+        stored = self.collection.get(where={"source": chunks[0]["source"]}, include=["metadatas"])
+        return (
+            sorted(stored["ids"]) == sorted(chunk["id"] for chunk in chunks)
+            and all(metadata.get("hash") == key for metadata in stored["metadatas"])
+        )
+
     def add_document(self, file_path: str) -> bool:
         """Add a single document to the knowledge base."""
+        return self.add_documents([file_path]).get(file_path, False)
+
+    def _parse_in_processes(self, file_paths: List[str], workers: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Extract and chunk files in a pool of worker processes."""
+        chunks_by_path = {}
+        # Spawn rather than fork: the server process already runs threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {
+                pool.submit(parse_and_chunk, path, self.chunk_size, self.chunk_overlap): path
+                for path in file_paths
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    chunks_by_path[path] = future.result()
+                except Exception as e:
+                    self.logger.error(f"Error parsing {path}: {str(e)}")
+                    chunks_by_path[path] = []
+        return chunks_by_path
+
+    def add_documents(self, file_paths: List[str], max_workers: int = UPLOAD_CONCURRENCY,
+                      parse_workers: int = 0) -> Dict[str, bool]:
+        """Add several documents, embedding all of their new chunks in one batch.
+
+        Files are extracted and chunked in parallel threads, or in
+        ``parse_workers`` processes when more than one is given. Files whose
+        content is already in the embedding cache reuse their stored vectors,
+        and are skipped entirely when the collection already holds them; the
+        remaining chunks are embedded together, cached, and everything is
+        written in ``CHROMA_BATCH_SIZE`` batches.
+
+        Returns:
+            Mapping of file path to whether it was added
+        """
+        if not file_paths:
+            return {}
+        use_processes = parse_workers > 1 and len(file_paths) > 1
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_paths)))) as pool:
+            loaded = list(pool.map(lambda path: self._load_cached(path, parse=not use_processes), file_paths))
+
+        unparsed = [path for path, (_, chunks, _) in zip(file_paths, loaded) if chunks is None]
+        if unparsed:
+            parsed = self._parse_in_processes(unparsed, min(parse_workers, len(unparsed)))
+            loaded = [
+                (key, parsed[path], None) if chunks is None else (key, chunks, vectors)
+                for path, (key, chunks, vectors) in zip(file_paths, loaded)
+            ]
+
+        results = {path: bool(chunks) for path, (_, chunks, _) in zip(file_paths, loaded)}
+        if not any(results.values()):
+            return results
+
         try:
-            text = self._extract_text_from_file(file_path)
-            
-            if not text:
-                self.logger.warning(f"Could not extract text from {file_path}")
-                return False
-            
-            chunks = self._chunk_text(text, file_path)
-            
-            if not chunks:
-                self.logger.warning(f"No chunks created from {file_path}")
-                return False
-            
-            # Prepare data for Chroma
-            ids = [chunk["id"] for chunk in chunks]
-            texts = [chunk["text"] for chunk in chunks]
-            metadatas = [{"source": chunk["source"]} for chunk in chunks]
-            
-            # Add to collection
-            self.collection.add(
-                ids=ids,
-                documents=texts,
-                metadatas=metadatas
+            self._ensure_collection()
+            unchanged = {
+                i for i, (key, chunks, vectors) in enumerate(loaded)
+                if key and chunks and vectors is not None and self._is_stored(key, chunks)
+            }
+            pending = [i for i, (_, chunks, vectors) in enumerate(loaded) if chunks and vectors is None]
+            texts = [chunk["text"] for i in pending for chunk in loaded[i][1]]
+            # Repeated chunks (shared boilerplate, overlapping uploads) are embedded once
+            unique_texts = {text: row for row, text in enumerate(dict.fromkeys(texts))}
+            if texts:
+                unique_vectors = np.asarray(self.embedding_function(list(unique_texts)), dtype=np.float32)
+                fresh = unique_vectors[[unique_texts[text] for text in texts]]
+                offset = 0
+                for i in pending:
+                    key, chunks, _ = loaded[i]
+                    loaded[i] = (key, chunks, fresh[offset:offset + len(chunks)])
+                    offset += len(chunks)
+
+            embedded = [entry for i, entry in enumerate(loaded) if entry[1] and i not in unchanged]
+            if not embedded:
+                self.logger.info(f"All {len(unchanged)} documents already in knowledge base")
+                return results
+            for key, chunks, _ in embedded:
+                for chunk in chunks:
+                    chunk["hash"] = key
+            all_chunks = [chunk for _, chunks, _ in embedded for chunk in chunks]
+            # Re-uploaded files replace their previous chunks rather than mixing with
+            # them: matching ids are overwritten in place and only the leftovers deleted
+            replaced = [chunks[0]["source"] for _, chunks, _ in embedded]
+            new_ids = {chunk["id"] for chunk in all_chunks}
+            with self._write_lock:
+                existing = self.collection.get(where={"source": {"$in": replaced}}, include=[])["ids"]
+                stale = [chunk_id for chunk_id in existing if chunk_id not in new_ids]
+                if stale:
+                    self.collection.delete(ids=stale)
+                    self._collection_changed()
+            self._add_chunks(all_chunks, np.vstack([vectors for _, _, vectors in embedded]))
+            self.logger.info(
+                f"Added {len(all_chunks)} chunks from {len(embedded)} documents to knowledge base "
+                f"({len(unique_texts)} newly embedded, {len(unchanged)} documents unchanged)"
             )
-            
-            self.logger.info(f"Added {len(chunks)} chunks from {file_path} to knowledge base")
+        except Exception as e:
+            self.logger.error(f"Error adding documents: {str(e)}")
+            return {path: False for path in file_paths}
+
+        for i in pending:
+            key, chunks, vectors = loaded[i]
+            if key is None:
+                continue
+            try:
+                self.embedding_cache.put(key, [chunk["text"] for chunk in chunks], vectors)
+            except Exception as e:
+                self.logger.warning(f"Could not cache embeddings for {chunks[0]['source']}: {e}")
+        return results
+    
+    def remove_document(self, file_path: str) -> bool:
+        """Delete a document's vectors from the collection without rebuilding."""
+        try:
+            self._ensure_collection()
+            with self._write_lock:
+                self.collection.delete(where={"source": file_path})
+            self._collection_changed()
+            self.logger.info(f"Removed vectors for {file_path} from knowledge base")
+            self._prune_embedding_cache()
             return True
-        
         except Exception as e:
-            self.logger.error(f"Error adding document {file_path}: {str(e)}")
+            self.logger.error(f"Error removing document {file_path}: {str(e)}")
             return False
-    
-    def rebuild_knowledge_base(self) -> bool:
-        """Rebuild the entire knowledge base from documents."""
+
+    def _prune_embedding_cache(self) -> None:
+        """Drop cached embeddings of file contents no stored chunk was built from."""
         try:
-            # Reset collection
-            # Delete then recreate collection
-            try:
-                self.client.delete_collection(self.collection_name)
-                self.logger.info(f"Deleted existing collection {self.collection_name}")
-            except ValueError:
-                self.logger.info("No existing collection to delete for rebuild")
+            with self._write_lock:
+                metadatas = self.collection.get(include=["metadatas"])["metadatas"]
+                removed = self.embedding_cache.prune({m["hash"] for m in metadatas if m and m.get("hash")})
+            if removed:
+                self.logger.info(f"Pruned {removed} stale entries from the embedding cache")
+        except Exception as e:
+            self.logger.warning(f"Could not prune embedding cache: {e}")
 
-            self.collection = self.client.create_collection(
-                name=self.collection_name,
-                embedding_function=self.embedding_function,
-                metadata={"tenant": self.tenant_id}
-            )
-            
-            # Add all documents
-            success = True
+    def _index_settings_changed(self) -> bool:
+        """Whether the collection was built with different HNSW parameters than configured."""
+        current = self.collection.metadata or {}
+        return any(current.get(k) != v for k, v in self._collection_metadata().items() if k.startswith("hnsw:"))
+
+    def rebuild_knowledge_base(self, full: bool = False) -> bool:
+        """Bring the knowledge base in line with the documents directory.
+
+        Documents whose content is unchanged keep their vectors, changed
+        ones are re-indexed and vectors of removed documents are deleted.
+        The collection is recreated from scratch when ``full`` is set or its
+        HNSW parameters differ from the configured ones.
+        """
+        try:
             documents = list_documents(self.documents_dir)
             self.logger.info(f"Found {len(documents)} documents to process")
+            file_paths = [os.path.join(self.documents_dir, file) for file in documents]
+
+            self._ensure_collection()
+            if full or self._index_settings_changed():
+                self._reset_collection()
             
-            for file in documents:
-                file_path = os.path.join(self.documents_dir, file)
-                if not self.add_document(file_path):
+            # Unchanged files are skipped or reuse their cached embeddings;
+            # PDF extraction is CPU-bound, so a rebuild parses in worker processes
+            results = self.add_documents(file_paths, parse_workers=PARSE_WORKERS)
+            for file, file_path in zip(documents, file_paths):
+                if not results.get(file_path, False):
                     self.logger.warning(f"Failed to process {file}")
-                    success = False
-            
-            return success
+
+            # Drop vectors of documents that are gone or could not be processed
+            indexed = [path for path in file_paths if results.get(path, False)]
+            with self._write_lock:
+                if indexed:
+                    self.collection.delete(where={"source": {"$nin": indexed}})
+                    self._collection_changed()
+                else:
+                    self._reset_collection()
+            self._prune_embedding_cache()
+
+            return all(results.values())
         
         except Exception as e:
             self.logger.error(f"Error rebuilding knowledge base: {str(e)}")
             return False
     
+    def _embed_query(self, normalized_text: str) -> np.ndarray:
+        vec = np.asarray(self._query_batcher.submit(normalized_text), dtype=np.float32)
+        # Shared by every caller that hits the cache
+        vec.flags.writeable = False
+        return vec
+
+    @staticmethod
+    def _normalize_query(query_text: str) -> str:
+        return " ".join(query_text.split()).lower()
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        """Embed a query string, reusing the vector for repeated (normalized) queries."""
+        return self._embed_query_cached(self._normalize_query(query_text))
+
+    def query_embedding_cache_info(self) -> Dict[str, int]:
+        info = self._embed_query_cached.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+    @staticmethod
+    def _source_name(metadata: Dict[str, Any]) -> str:
+        """Display name of a chunk's source; vectors stored before names were recorded fall back to the path."""
+        name = metadata.get('name')
+        if name:
+            return name
+        source = metadata.get('source')
+        return os.path.basename(source) if source else 'Unknown'
+
     def query(self, query_text: str, k: int = 3) -> Tuple[List[str], List[str]]:
         """
         Retrieve relevant documents for a query.
         
         Returns:
-            Tuple of (content_list, source_list)
+            Tuple of (content_list, source_name_list)
+        """
+        self.logger.debug("Querying knowledge base with: '%.80s'", query_text)
+        key = (self._normalize_query(query_text), k)
+        with self._results_lock:
+            generation = self._generation
+            cached = self._results.get(key)
+            if cached is not None:
+                if time.monotonic() - cached[0] > QUERY_RESULT_CACHE_TTL:
+                    del self._results[key]
+                    cached = None
+                else:
+                    self._results.move_to_end(key)
+        if cached is not None:
+            return list(cached[1]), list(cached[2])
+
+        try:
+            embedding = self._embed_query_cached(key[0])
+        except Exception as e:
+            self.logger.error(f"Error embedding query: {str(e)}")
+            return [], []
+        documents, sources = self.query_by_vector(embedding, k)
+
+        # Empty results may be a transient error; results computed across a write are stale
+        if documents:
+            with self._results_lock:
+                if generation == self._generation:
+                    self._results[key] = (time.monotonic(), documents, sources)
+                    if len(self._results) > QUERY_RESULT_CACHE_SIZE:
+                        self._results.popitem(last=False)
+        return list(documents), list(sources)
+
+    def _fallback_document(self) -> Optional[Tuple[str, str]]:
+        """First stored chunk and its source name, looked up once per collection state."""
+        current = self._generation
+        generation, cached = self._fallback
+        if generation == current:
+            return cached
+        first = self.collection.get(limit=1)
+        cached = None
+        if first and first.get('documents'):
+            source = self._source_name(first['metadatas'][0]) if first.get('metadatas') else "Unknown"
+            cached = (first['documents'][0], source)
+        self._fallback = (current, cached)
+        return cached
+
+    async def aquery(self, query_text: str, k: int = 3) -> Tuple[List[str], List[str]]:
+        """`query` run in a worker thread, keeping embedding and search off the event loop."""
+        return await asyncio.to_thread(self.query, query_text, k)
+
+    def _search_many(self, requests: List[Tuple[List[float], int]]) -> List[Dict[str, Any]]:
+        """Run several (embedding, k) searches with one collection query per distinct k."""
+        by_k: Dict[int, List[int]] = {}
+        for i, (_, k) in enumerate(requests):
+            by_k.setdefault(k, []).append(i)
+        results: List[Dict[str, Any]] = [{}] * len(requests)
+        for k, indices in by_k.items():
+            batch = self.collection.query(query_embeddings=[requests[i][0] for i in indices], n_results=k)
+            for row, i in enumerate(indices):
+                results[i] = {
+                    key: [batch[key][row]] for key in ('documents', 'metadatas') if batch.get(key)
+                }
+        return results
+
+    def query_by_vector(self, embedding, k: int = 3) -> Tuple[List[str], List[str]]:
+        """
+        Retrieve relevant documents for an already embedded query.
+        
+        Returns:
+            Tuple of (content_list, source_name_list)
         """
         try:
             # Try to ensure we get results - REMOVING include_distances
-            self.logger.info(f"Querying knowledge base with: '{query_text}'")
             self._ensure_collection()
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=k
-            )
+            results = self._search_batcher.submit((np.asarray(embedding, dtype=np.float32).tolist(), k))
             
             # Check if we have results
             if results and 'documents' in results and results['documents'] and results['documents'][0]:
@@ -334,32 +645,26 @@ class KnowledgeBase:
                 # Check if metadatas exists in results
                 if 'metadatas' in results and results['metadatas'] and results['metadatas'][0]:
                     metadatas = results['metadatas'][0]
-                    sources = [metadata.get('source', 'Unknown') for metadata in metadatas]
+                    sources = [self._source_name(metadata) for metadata in metadatas]
                 else:
                     self.logger.warning("No metadata found in results")
                     sources = ["Unknown"] * len(documents)
                 
-                for i, doc in enumerate(documents):
-                    self.logger.info(f"Match {i+1}: {doc[:50]}...")
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    for i, doc in enumerate(documents):
+                        self.logger.debug("Match %d: %.50s...", i + 1, doc)
                 
                 return documents, sources
             else:
                 self.logger.warning("No matching documents found in knowledge base")
-                self.logger.info(f"Results keys: {results.keys() if results else 'None'}")
+                self.logger.debug("Results keys: %s", results.keys() if results else None)
                 
                 # Fallback: return a representative document anyway
                 try:
-                    # Try to get all documents
-                    all_ids = self.collection.get(limit=1)
-                    if all_ids and 'documents' in all_ids and all_ids['documents']:
+                    fallback = self._fallback_document()
+                    if fallback is not None:
                         self.logger.info("Using fallback document from knowledge base")
-                        
-                        if 'metadatas' in all_ids and all_ids['metadatas']:
-                            source = all_ids['metadatas'][0].get('source', 'Unknown')
-                        else:
-                            source = "Unknown"
-                            
-                        return [all_ids['documents'][0]], [source]
+                        return [fallback[0]], [fallback[1]]
                 except Exception as e:
                     self.logger.error(f"Error getting fallback document: {str(e)}")
             
@@ -369,26 +674,53 @@ class KnowledgeBase:
             self.logger.error(f"Error querying knowledge base: {str(e)}")
             return [], []
     
-    def get_status(self) -> Dict[str, Any]:
-        """Get status of the knowledge base."""
-        document_count = len(list_documents(self.documents_dir))
-        
+    def close(self):
+        """Release file handles held outside Chroma's shared client cache."""
+        self.embedding_cache.close()
+
+    def vector_count(self) -> int:
+        """Number of stored chunks, or 0 when the collection is unavailable.
+
+        Counted once per collection state (every write here bumps the generation)
+        and again after QUERY_RESULT_CACHE_TTL, to pick up other workers' writes.
+        """
         try:
+            current = self._generation
+            generation, count, counted_at = self._count
+            if generation == current and time.monotonic() - counted_at <= QUERY_RESULT_CACHE_TTL:
+                return count
             self._ensure_collection()
-            vector_count = self.collection.count()
+            count = self.collection.count()
+            if count:
+                # Like retrieval results, an empty answer is not cached, so documents
+                # written by another worker process become visible
+                self._count = (current, count, time.monotonic())
+            return count
         except Exception as e:
             self.logger.error(f"Error getting vector count: {str(e)}")
-            vector_count = 0
+            return 0
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get status of the knowledge base."""
+        documents = list_documents(self.documents_dir)
         
         return {
-            "document_count": document_count,
-            "vector_count": vector_count,
-            "documents": list_documents(self.documents_dir)
+            "document_count": len(documents),
+            "vector_count": self.vector_count(),
+            "documents": documents
         }
 
 def get_knowledge_base(tenant_id: Optional[str]) -> KnowledgeBase:
     """Get or create a cached knowledge base for a tenant."""
     tid = tenant_id or "default"
-    if tid not in _kb_cache:
-        _kb_cache[tid] = KnowledgeBase(tenant_id=tid)
-    return _kb_cache[tid]
\ No newline at end of file
+    with _kb_cache_lock:
+        kb = _kb_cache.get(tid)
+        if kb is not None:
+            _kb_cache.move_to_end(tid)
+            return kb
+        kb = _kb_cache[tid] = KnowledgeBase(tenant_id=tid)
+        # Bound memory with many tenants by closing the least recently used ones
+        while len(_kb_cache) > KB_CACHE_MAX_TENANTS:
+            _, evicted = _kb_cache.popitem(last=False)
+            evicted.close()
+        return kb
\ No newline at end of file
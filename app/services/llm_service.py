@@ -1,12 +1,40 @@
-import requests
+import asyncio
+import httpx
 import os
+import orjson
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-from app.config import LM_STUDIO_URL
+import time
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from app.config import LM_STUDIO_URL, LM_STUDIO_TIMEOUT, LM_STUDIO_CONNECT_TIMEOUT, LM_STUDIO_CONNECT_RETRIES, LM_STUDIO_MAX_CONNECTIONS, LM_STUDIO_MAX_KEEPALIVE, LM_STUDIO_CACHE_PROMPT
 from app.services.knowledge_service import get_knowledge_base
 from app.models import ChatMessage
-from app.utils.prompt_builder import build_knowledge_prompt, build_regular_chat_prompt
-from app.utils.personas import get_persona  # Updated import path
+from app.utils.prompt_builder import build_knowledge_prompt, build_regular_chat_prompt, join_contexts
+from app.utils.personas import get_persona_temperature
+
+def sse_data(obj: Dict[str, Any]) -> bytes:
+    """Encode an OpenAI-style server-sent event data frame."""
+    return b"data: " + orjson.dumps(obj) + b"\n\n"
+
+SSE_DONE = b"data: [DONE]\n\n"
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Prompts start with a static per-persona prefix, so the server can skip re-prefilling it
+_SERVER_OPTIONS = {"cache_prompt": True} if LM_STUDIO_CACHE_PROMPT else {}
+
+# Idle pooled connections are closed after this many seconds
+KEEPALIVE_EXPIRY = 5.0
+# Bytes of an LM Studio error body kept in logs and exceptions
+ERROR_BODY_LIMIT = 512
+
+
+class LMStudioError(Exception):
+    """Raised when LM Studio answers with a non-200 status; carries a truncated body."""
+
+    def __init__(self, status_code: int, body: bytes):
+        self.status_code = status_code
+        self.body = body[:ERROR_BODY_LIMIT]
+        super().__init__(
+            f"LM Studio API error {status_code}: {self.body.decode('utf-8', errors='replace')}"
+        )
 
 class LLMService:
     def __init__(self):
@@ -17,168 +45,347 @@ class LLMService:
         self.offline = os.getenv("OFFLINE_MODE", "0") == "1"
         if self.offline:
             self.logger.warning("OFFLINE_MODE enabled: external LM Studio calls will be stubbed.")
+        # Shared keep-alive pool so concurrent requests reuse connections to LM Studio.
+        # Only connection attempts are retried, so a request is never sent twice.
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(LM_STUDIO_TIMEOUT, connect=LM_STUDIO_CONNECT_TIMEOUT),
+            transport=httpx.AsyncHTTPTransport(
+                retries=LM_STUDIO_CONNECT_RETRIES,
+                limits=httpx.Limits(
+                    max_connections=LM_STUDIO_MAX_CONNECTIONS,
+                    max_keepalive_connections=LM_STUDIO_MAX_KEEPALIVE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY
+                )
+            )
+        )
+        self._last_request = 0.0
+        self._background = set()
+
+    async def aclose(self):
+        """Close the pooled LM Studio connections."""
+        await self.client.aclose()
+
+    def _warm_pool(self):
+        """Open a connection to LM Studio while retrieval runs, if the pool has gone idle."""
+        now = time.monotonic()
+        idle = now - self._last_request >= KEEPALIVE_EXPIRY
+        self._last_request = now
+        if self.offline or not idle:
+            return
+        task = asyncio.create_task(self._ping())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _ping(self):
+        try:
+            await self.client.get("/models")
+        except httpx.HTTPError as e:
+            self.logger.debug(f"LM Studio warmup request failed: {e}")
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST a JSON body to LM Studio, encoded with orjson."""
+        return await self.client.post(path, content=orjson.dumps(payload), headers=_JSON_HEADERS)
 
     def _kb(self, tenant_id: Optional[str]):
         return get_knowledge_base(tenant_id)
-    
-    def generate_completion(
-        self, 
-        prompt: str, 
-        max_tokens: int = 200, 
-        temperature: float = 0.7,
-    use_knowledge_base: bool = True,
-        persona: str = "default",
-        tenant_id: Optional[str] = None
-    ) -> Tuple[str, Optional[List[str]]]:
-        """
-        Generate text completion with optional knowledge base context.
-        
+
+    def _prepare_completion(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        use_knowledge_base: bool,
+        persona: str,
+        tenant_id: Optional[str]
+    ) -> Tuple[Dict[str, Any], List[str], str]:
+        """Retrieve context and build the /completions payload.
+
         Returns:
-            Tuple of (generated_text, source_documents)
+            Tuple of (payload, source_documents, context)
         """
         context = ""
         sources = []
-        
-        # Get persona configuration
-        persona_config = get_persona(persona)
-        persona_temp = persona_config.get("temperature", temperature)
-        
+
+        persona_temp = get_persona_temperature(persona, temperature)
+
         # Retrieve context from knowledge base if requested
         if use_knowledge_base:
-            self.logger.info(f"Knowledge base enabled for completion, querying with: '{prompt[:50]}...'")
+            self.logger.debug("Knowledge base enabled for completion, querying with: '%.50s...'", prompt)
             contexts, sources = self._kb(tenant_id).query(prompt)
             if contexts:
-                context = "\n\n".join(contexts)
-                self.logger.info(f"Retrieved {len(contexts)} contexts for completion")
+                context = join_contexts(contexts)
+                self.logger.info("Retrieved %d contexts for completion", len(contexts))
             else:
                 self.logger.warning("Knowledge base query returned no contexts despite being enabled")
         else:
-            self.logger.info("Knowledge base disabled for completion request")
-        
+            self.logger.debug("Knowledge base disabled for completion request")
+
         # Build the prompt with context if available
         enhanced_prompt = prompt
         if context:
             # Use the prompt builder with persona and few-shot examples
             enhanced_prompt = build_knowledge_prompt(context, prompt, persona)
-            self.logger.info(f"Using persona '{persona}' for knowledge-enhanced prompt")
-        
-        if self.offline:
-            stub = f"[OFFLINE RESPONSE] Persona={persona}. Prompt='{prompt[:60]}...'" + (" With context." if context else "")
-            return stub, sources
+            self.logger.debug("Using persona '%s' for knowledge-enhanced prompt", persona)
 
-        # Call LM Studio API
-        url = f"{self.base_url}/completions"
-        
         payload = {
             "prompt": enhanced_prompt,
             "max_tokens": max_tokens,
             "temperature": persona_temp,
-            "stream": False
+            "stream": False,
+            **_SERVER_OPTIONS
         }
-        
-        try:
-            response = requests.post(url, json=payload)
-            
-            if response.status_code == 200:
-                return response.json()["choices"][0]["text"], sources
-            else:
-                self.logger.error(f"Error from LM Studio API: {response.text}")
-                raise Exception(f"Error calling LM Studio API: {response.text}")
-        except Exception as e:
-            self.logger.error(f"Error generating completion: {str(e)}")
-            raise
-    
-    def generate_chat_completion(
-        self, 
-        messages: List[ChatMessage], 
-        max_tokens: int = 200, 
-        temperature: float = 0.7,
-    use_knowledge_base: bool = True,
-    persona: str = "default",
-    tenant_id: Optional[str] = None
-    ) -> Tuple[str, Optional[List[str]]]:
-        """Generate chat completion, optionally enriched with knowledge base context."""
+        return payload, sources, context
+
+    def _prepare_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float,
+        use_knowledge_base: bool,
+        persona: str,
+        tenant_id: Optional[str]
+    ) -> Tuple[str, str, List[str], float]:
+        """Extract the last user message and retrieve KB context for a chat.
+
+        Returns:
+            Tuple of (last_user_message, context, source_documents, persona_temperature)
+        """
         # 1. Extract last user message
         last_user_message = next((m.content for m in reversed(messages) if m.role == "user"), "")
-        self.logger.info(
-            f"Chat completion requested (use_kb={use_knowledge_base}, persona={persona}) last_user='{last_user_message[:50]}...'"
+        self.logger.debug(
+            "Chat completion requested (use_kb=%s, persona=%s) last_user='%.50s...'",
+            use_knowledge_base, persona, last_user_message
         )
 
-        # 2. Persona configuration
-        persona_config = get_persona(persona)
-        persona_temp = persona_config.get("temperature", temperature)
+        # 2. Persona temperature
+        persona_temp = get_persona_temperature(persona, temperature)
 
-        # 3. Knowledge base status & optional retrieval
-        kb_status = self._kb(tenant_id).get_status()
-        self.logger.info(
-            f"KB status: docs={kb_status['document_count']} vectors={kb_status['vector_count']}"
-        )
+        # 3. Optional retrieval; only the vector count is needed, not a directory scan
         context = ""
         sources: List[str] = []
+        vector_count = self._kb(tenant_id).vector_count() if use_knowledge_base and last_user_message else 0
+        self.logger.debug("KB vectors=%d", vector_count)
 
-        if (
-            use_knowledge_base
-            and last_user_message
-            and kb_status.get("vector_count", 0) > 0
-        ):
+        if vector_count > 0:
             contexts, sources = self._kb(tenant_id).query(last_user_message)
             if contexts:
-                context = "\n\n".join(contexts)
-                self.logger.info(f"Retrieved {len(contexts)} context chunk(s)")
+                context = join_contexts(contexts)
+                self.logger.info("Retrieved %d context chunk(s)", len(contexts))
             else:
                 self.logger.warning("KB query returned no contexts")
         else:
             if not use_knowledge_base:
-                self.logger.info("KB usage disabled by request")
+                self.logger.debug("KB usage disabled by request")
             elif not last_user_message:
                 self.logger.warning("No user message to query KB with")
-            elif kb_status.get("vector_count", 0) <= 0:
+            else:
                 self.logger.warning("KB empty (no vectors)")
 
+        return last_user_message, context, sources, persona_temp
+
+    def _chat_payload(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: int,
+        persona: str,
+        persona_temp: float
+    ) -> Dict[str, Any]:
+        """Build the /chat/completions payload with the persona system message."""
+        # A generator: build_regular_chat_prompt unpacks it straight into the final list
+        api_messages = ({"role": m.role, "content": m.content} for m in messages)
+        enhanced_messages = build_regular_chat_prompt(api_messages, persona)
+        return {
+            "messages": enhanced_messages,
+            "max_tokens": max_tokens,
+            "temperature": persona_temp,
+            "stream": False,
+            **_SERVER_OPTIONS,
+        }
+
+    async def generate_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 200,
+        temperature: float = 0.7,
+        use_knowledge_base: bool = True,
+        persona: str = "default",
+        tenant_id: Optional[str] = None
+    ) -> Tuple[str, Optional[List[str]]]:
+        """
+        Generate text completion with optional knowledge base context.
+
+        Returns:
+            Tuple of (generated_text, source_documents)
+        """
+        self._warm_pool()
+        # Retrieval embeds and searches synchronously; keep it off the event loop
+        payload, sources, context = await asyncio.to_thread(
+            self._prepare_completion,
+            prompt, max_tokens, temperature, use_knowledge_base, persona, tenant_id
+        )
+
+        if self.offline:
+            stub = f"[OFFLINE RESPONSE] Persona={persona}. Prompt='{prompt[:60]}...'" + (" With context." if context else "")
+            return stub, sources
+
+        # Call LM Studio API
+        try:
+            response = await self._post("/completions", payload)
+
+            if response.status_code == 200:
+                return orjson.loads(response.content)["choices"][0]["text"], sources
+            else:
+                raise LMStudioError(response.status_code, response.content)
+        except Exception as e:
+            self.logger.error(f"Error generating completion: {str(e)}")
+            raise
+
+    async def generate_chat_completion(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: int = 200,
+        temperature: float = 0.7,
+        use_knowledge_base: bool = True,
+        persona: str = "default",
+        tenant_id: Optional[str] = None
+    ) -> Tuple[str, Optional[List[str]]]:
+        """Generate chat completion, optionally enriched with knowledge base context."""
+        self._warm_pool()
+        last_user_message, context, sources, persona_temp = await asyncio.to_thread(
+            self._prepare_chat,
+            messages, temperature, use_knowledge_base, persona, tenant_id
+        )
+
         # 4. If we have context, attempt knowledge-enhanced completion path
         if context:
             prompt = build_knowledge_prompt(context, last_user_message, persona)
-            url = f"{self.base_url}/completions"
             payload = {
                 "prompt": prompt,
                 "max_tokens": max_tokens,
                 "temperature": persona_temp,
                 "stream": False,
+                **_SERVER_OPTIONS,
             }
             if self.offline:
                 return f"[OFFLINE CHAT COMPLETION WITH CONTEXT] {last_user_message[:80]}...", sources
             try:
-                resp = requests.post(url, json=payload)
+                resp = await self._post("/completions", payload)
                 if resp.status_code == 200:
-                    answer = resp.json()["choices"][0]["text"]
+                    answer = orjson.loads(resp.content)["choices"][0]["text"]
                     return answer, sources
                 else:
                     self.logger.error(
-                        f"Completions API (with context) error {resp.status_code}: {resp.text}"
+                        "Completions API (with context) error %d: %r",
+                        resp.status_code, resp.content[:ERROR_BODY_LIMIT]
                     )
             except Exception as e:
                 self.logger.error(f"Knowledge-enhanced completion failed: {e}")
                 # Fall through to chat approach
 
         # 5. Fallback to standard chat
-        api_messages = [{"role": m.role, "content": m.content} for m in messages]
-        enhanced_messages = build_regular_chat_prompt(api_messages, persona)
-        url = f"{self.base_url}/chat/completions"
-        payload = {
-            "messages": enhanced_messages,
-            "max_tokens": max_tokens,
-            "temperature": persona_temp,
-            "stream": False,
-        }
+        payload = self._chat_payload(messages, max_tokens, persona, persona_temp)
         if self.offline:
             return f"[OFFLINE CHAT RESPONSE] {last_user_message[:80]}...", []
         try:
-            resp = requests.post(url, json=payload)
+            resp = await self._post("/chat/completions", payload)
             if resp.status_code == 200:
-                answer = resp.json()["choices"][0]["message"]["content"]
+                answer = orjson.loads(resp.content)["choices"][0]["message"]["content"]
                 return answer, []  # sources empty because chat path
             else:
-                raise Exception(f"Chat API error {resp.status_code}: {resp.text}")
+                raise LMStudioError(resp.status_code, resp.content)
         except Exception as e:
             self.logger.error(f"Error generating chat completion: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    async def _stream(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[bytes]:
+        """Forward LM Studio's server-sent event stream as raw bytes."""
+        try:
+            body = orjson.dumps({**payload, "stream": True})
+            async with self.client.stream("POST", path, content=body, headers=_JSON_HEADERS) as resp:
+                if resp.status_code != 200:
+                    body = b""
+                    async for part in resp.aiter_bytes():
+                        body += part
+                        if len(body) >= ERROR_BODY_LIMIT:
+                            break
+                    self.logger.error(
+                        "Streaming error from LM Studio %d: %r", resp.status_code, body[:ERROR_BODY_LIMIT]
+                    )
+                    yield sse_data({"error": f"LM Studio API error {resp.status_code}"})
+                    return
+                async for chunk in resp.aiter_bytes():
+                    yield chunk
+        except httpx.HTTPError as e:
+            # Headers are already sent, so report the failure in-band
+            self.logger.error(f"Error streaming from LM Studio: {e}")
+            yield sse_data({"error": str(e)})
+
+    async def _stream_stub(self, frame: Dict[str, Any]) -> AsyncIterator[bytes]:
+        yield sse_data({"choices": [frame]})
+        yield SSE_DONE
+
+    async def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: int = 200,
+        temperature: float = 0.7,
+        use_knowledge_base: bool = True,
+        persona: str = "default",
+        tenant_id: Optional[str] = None
+    ) -> Tuple[List[str], AsyncIterator[bytes]]:
+        """Retrieve context, then stream the completion from LM Studio.
+
+        Returns:
+            Tuple of (source_documents, server-sent event byte stream)
+        """
+        self._warm_pool()
+        # Retrieval embeds and searches synchronously; keep it off the event loop
+        payload, sources, context = await asyncio.to_thread(
+            self._prepare_completion,
+            prompt, max_tokens, temperature, use_knowledge_base, persona, tenant_id
+        )
+        if self.offline:
+            stub = f"[OFFLINE RESPONSE] Persona={persona}. Prompt='{prompt[:60]}...'" + (" With context." if context else "")
+            return sources, self._stream_stub({"text": stub})
+        return sources, self._stream("/completions", payload)
+
+    async def stream_chat_completion(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: int = 200,
+        temperature: float = 0.7,
+        use_knowledge_base: bool = True,
+        persona: str = "default",
+        tenant_id: Optional[str] = None
+    ) -> Tuple[List[str], AsyncIterator[bytes]]:
+        """Retrieve context, then stream the chat answer from LM Studio.
+
+        With knowledge base context the stream comes from /completions
+        (``choices[0].text`` frames); otherwise from /chat/completions
+        (``choices[0].delta.content`` frames).
+
+        Returns:
+            Tuple of (source_documents, server-sent event byte stream)
+        """
+        self._warm_pool()
+        last_user_message, context, sources, persona_temp = await asyncio.to_thread(
+            self._prepare_chat,
+            messages, temperature, use_knowledge_base, persona, tenant_id
+        )
+        if context:
+            if self.offline:
+                stub = f"[OFFLINE CHAT COMPLETION WITH CONTEXT] {last_user_message[:80]}..."
+                return sources, self._stream_stub({"text": stub})
+            payload = {
+                "prompt": build_knowledge_prompt(context, last_user_message, persona),
+                "max_tokens": max_tokens,
+                "temperature": persona_temp,
+                **_SERVER_OPTIONS,
+            }
+            return sources, self._stream("/completions", payload)
+
+        if self.offline:
+            stub = f"[OFFLINE CHAT RESPONSE] {last_user_message[:80]}..."
+            return [], self._stream_stub({"delta": {"content": stub}})
+        payload = self._chat_payload(messages, max_tokens, persona, persona_temp)
+        return [], self._stream("/chat/completions", payload)
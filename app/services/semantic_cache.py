@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+class _Namespace:
+    """Vectors and payloads cached for one (endpoint, tenant, persona, kb) key."""
+
+    def __init__(self, dim: int):
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.stored_at = np.empty(0, dtype=np.float64)
+        self.payloads: List[Tuple[str, Optional[List[str]]]] = []
+
+
+class SemanticCache:
+    """Similarity-keyed response cache.
+
+    Responses are stored against the normalized embedding of the prompt that
+    produced them; a lookup returns the stored response when the cosine
+    similarity of the new prompt is at least ``threshold`` and the entry is
+    younger than ``ttl_seconds``.
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._namespaces: Dict[Hashable, _Namespace] = {}
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+    def lookup(self, namespace: Hashable, embedding: Any) -> Optional[Tuple[str, Optional[List[str]]]]:
+        """Return the cached ``(text, sources)`` closest to ``embedding`` or None."""
+        vec = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is not None and len(ns.payloads) and ns.vectors.shape[1] == vec.shape[0]:
+                scores = ns.vectors @ vec
+                scores[now - ns.stored_at > self.ttl_seconds] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return ns.payloads[best]
+            self.misses += 1
+            return None
+
+    def store(self, namespace: Hashable, embedding: Any, text: str, sources: Optional[List[str]]) -> None:
+        """Cache a response under ``embedding``, evicting expired and oldest entries."""
+        vec = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None or ns.vectors.shape[1] != vec.shape[0]:
+                ns = self._namespaces[namespace] = _Namespace(vec.shape[0])
+            keep = now - ns.stored_at <= self.ttl_seconds
+            if len(ns.payloads) and keep.sum() >= self.max_entries:
+                # Drop the oldest live entries so the new one fits
+                keep[np.flatnonzero(keep)[: keep.sum() - self.max_entries + 1]] = False
+            ns.vectors = np.vstack([ns.vectors[keep], vec[None, :]])
+            ns.stored_at = np.append(ns.stored_at[keep], now)
+            ns.payloads = [p for p, k in zip(ns.payloads, keep) if k]
+            ns.payloads.append((text, sources))
+
+    def invalidate(self, match: Callable[[Hashable], bool]) -> int:
+        """Drop every namespace whose key satisfies ``match``; returns entries removed."""
+        with self._lock:
+            stale = [key for key in self._namespaces if match(key)]
+            return sum(len(self._namespaces.pop(key).payloads) for key in stale)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = sum(len(ns.payloads) for ns in self._namespaces.values())
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,61 @@
+# app/utils/cors.py - Allow-all CORS with precomputed headers
+
+# Headers that never vary between requests, encoded once
+_PREFLIGHT_HEADERS = (
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+    (b"access-control-max-age", b"600"),
+)
+_RESPONSE_HEADERS = (
+    (b"access-control-allow-origin", b"*"),
+)
+
+
+class StaticCORSMiddleware:
+    """Pure ASGI CORS middleware allowing any origin, method and header.
+
+    Equivalent to Starlette's CORSMiddleware with ``allow_origins=["*"]``,
+    ``allow_methods=["*"]`` and ``allow_headers=["*"]`` without credentials,
+    but preflights are answered directly and simple responses only get a
+    fixed header block appended. A literal ``*`` is sent, so browsers refuse
+    credentialed cross-origin requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        has_origin = False
+        requested_headers = None
+        is_preflight = False
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                has_origin = True
+            elif name == b"access-control-request-headers":
+                requested_headers = value
+            elif name == b"access-control-request-method":
+                is_preflight = True
+
+        if not has_origin:
+            # Not a cross-origin request
+            await self.app(scope, receive, send)
+            return
+
+        if is_preflight and scope["method"] == "OPTIONS":
+            headers = [*_PREFLIGHT_HEADERS, (b"content-length", b"0")]
+            if requested_headers:
+                headers.append((b"access-control-allow-headers", requested_headers))
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *_RESPONSE_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
@@ -1,30 +1,49 @@
 # app/utils/document_processor.py - Simplified version
 import os
-import glob
-from typing import List
+import shutil
+import uuid
+import re
+import logging
+from itertools import chain
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+UPLOAD_COPY_CHUNK = 1 << 20  # 1 MiB
+
+logger = logging.getLogger(__name__)
+
+# Extensions extract_text can parse
+SUPPORTED_EXTENSIONS = {".txt", ".pdf", ".docx"}
 
 def list_documents(directory: str) -> List[str]:
     """List all documents in the given directory."""
-    all_files = []
-    
-    # Check all supported file types
-    for ext in ["*.txt", "*.pdf", "*.docx"]:
-        all_files.extend(glob.glob(os.path.join(directory, ext)))
-    
-    # Extract just the filenames
-    filenames = [os.path.basename(file) for file in all_files]
-    
-    return filenames
+    # One directory pass; extensions match case-insensitively like extract_text
+    try:
+        with os.scandir(directory) as entries:
+            return [
+                entry.name for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS
+            ]
+    except FileNotFoundError:
+        return []
 
-def save_uploaded_file(file_content: bytes, filename: str, directory: str) -> str:
-    """Save uploaded file to the documents directory."""
+def save_uploaded_stream(source: BinaryIO, filename: str, directory: str) -> str:
+    """Copy an uploaded file object to the documents directory in 1 MiB chunks."""
     os.makedirs(directory, exist_ok=True)
     
     file_path = os.path.join(directory, filename)
     
-    # Write file to disk
-    with open(file_path, "wb") as f:
-        f.write(file_content)
+    # Stream to a temporary file so memory stays bounded regardless of upload size,
+    # then swap it in so readers never see a partially written document
+    source.seek(0)
+    part_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(part_path, "xb") as f:
+            shutil.copyfileobj(source, f, UPLOAD_COPY_CHUNK)
+        os.replace(part_path, file_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
     
     return file_path
 
@@ -36,4 +55,138 @@ def delete_document(filename: str, directory: str) -> bool:
         os.remove(file_path)
         return True
     
-    return False
\ No newline at end of file
+    return False
+
+# Parsing and chunking are plain functions so they can run in worker processes;
+# the parsers are imported on first use to keep worker startup cheap
+
+# Bumped whenever chunk boundaries change, so cached chunks are not reused
+CHUNKER_VERSION = 2
+_PARAGRAPH_BREAK = re.compile(r"\n\n+")
+_NON_BLANK = re.compile(r"\S(?:.*\S)?", re.DOTALL)
+
+def extract_text(file_path: str) -> Optional[str]:
+    """Extract text from various file types."""
+    try:
+        ext = os.path.splitext(file_path)[1].lower()
+        
+        if ext == '.txt':
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        
+        elif ext == '.pdf':
+            return _extract_pdf_text(file_path)
+        
+        elif ext == '.docx':
+            import docx2txt
+            return docx2txt.process(file_path)
+        
+        else:
+            logger.warning(f"Unsupported file type: {ext}")
+            return None
+    
+    except Exception as e:
+        logger.error(f"Error extracting text from {file_path}: {str(e)}")
+        return None
+
+def _extract_pdf_text(file_path: str) -> str:
+    """Page texts joined by newlines, using PDFium when it can read the file and pypdf otherwise."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return _extract_pdf_text_pypdf(file_path)
+
+    try:
+        return _extract_pdf_text_pdfium(pdfium, file_path)
+    except pdfium.PdfiumError as e:
+        # pypdf tolerates some malformed files PDFium refuses to load
+        logger.warning(f"PDFium could not read {file_path}, retrying with pypdf: {e}")
+        return _extract_pdf_text_pypdf(file_path)
+
+def _extract_pdf_text_pdfium(pdfium, file_path: str) -> str:
+    # PDFium is not thread-safe, so pages are read in order; documents are
+    # parallelized across processes instead
+    pages = []
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_bounded() + "\n")
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return "".join(pages)
+
+def _extract_pdf_text_pypdf(file_path: str) -> str:
+    import pypdf
+    with open(file_path, 'rb') as f:
+        # Pages without a text layer can yield None
+        return "".join((page.extract_text() or "") + "\n" for page in pypdf.PdfReader(f).pages)
+
+def chunk_text(text: str, source: str, chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """Split text into chunks of whole paragraphs with overlap.
+
+    Chunks are slices of ``text``: paragraphs (separated by blank lines) are
+    appended while the chunk stays within ``chunk_size`` characters, and each
+    new chunk starts ``chunk_overlap`` characters before the previous one
+    ended. A single paragraph longer than ``chunk_size`` becomes its own chunk.
+    """
+    chunks = []
+    base = os.path.basename(source)
+    
+    current_start = current_end = -1
+    for start, end in _paragraph_spans(text):
+        if current_start < 0:
+            current_start, current_end = start, end
+        elif end - current_start <= chunk_size:
+            current_end = end
+        else:
+            chunks.append({
+                "id": f"{base}-{len(chunks)}",
+                "text": text[current_start:current_end].strip(),
+                "source": source
+            })
+            # Carry the tail of the previous chunk into the next, unless the
+            # overlap would swallow the whole chunk
+            if current_end - current_start > chunk_overlap:
+                current_start = current_end - chunk_overlap
+            else:
+                current_start = start
+            current_end = end
+    
+    # Add the last chunk
+    if current_start >= 0:
+        chunks.append({
+            "id": f"{base}-{len(chunks)}",
+            "text": text[current_start:current_end].strip(),
+            "source": source
+        })
+    
+    logger.info(f"Split document into {len(chunks)} chunks")
+    return chunks
+
+def _paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) offsets of the non-blank paragraphs in ``text``, whitespace trimmed."""
+    start = 0
+    for separator in chain(_PARAGRAPH_BREAK.finditer(text), (None,)):
+        end = separator.start() if separator else len(text)
+        match = _NON_BLANK.search(text, start, end)
+        if match:
+            yield match.start(), match.end()
+        if separator:
+            start = separator.end()
+
+def parse_and_chunk(file_path: str, chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """Extract and chunk a document, returning no chunks on failure."""
+    text = extract_text(file_path)
+    
+    if not text:
+        logger.warning(f"Could not extract text from {file_path}")
+        return []
+    
+    chunks = chunk_text(text, file_path, chunk_size, chunk_overlap)
+    
+    if not chunks:
+        logger.warning(f"No chunks created from {file_path}")
+    return chunks
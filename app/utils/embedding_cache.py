@@ -0,0 +1,75 @@
+# app/utils/embedding_cache.py - Content-addressed store of document chunks and their embeddings
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Vectors are unit length, so half precision keeps retrieval ranking while halving storage
+STORAGE_DTYPE = np.float16
+
+
+def file_digest(file_path: str, salt: str = "") -> str:
+    """SHA-256 of a file's bytes, salted with whatever else determines its chunks and vectors."""
+    h = hashlib.sha256(salt.encode("utf-8"))
+    with open(file_path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            # Python 3.11+: hashes in OpenSSL without the GIL, using SHA extensions where available
+            return hashlib.file_digest(f, lambda: h).hexdigest()
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite table mapping a file digest to its chunk texts and embedding matrix.
+
+    Vectors are stored as float16 and returned as float32.
+    """
+
+    def __init__(self, db_path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, chunks BLOB, vectors BLOB)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunks, vectors FROM embeddings WHERE hash = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        texts = json.loads(row[0])
+        if not texts:
+            return texts, np.zeros((0, 0), dtype=np.float32)
+        vectors = np.frombuffer(row[1], dtype=STORAGE_DTYPE).reshape(len(texts), -1).astype(np.float32)
+        return texts, vectors
+
+    def put(self, key: str, texts: List[str], vectors) -> None:
+        matrix = np.asarray(vectors, dtype=STORAGE_DTYPE)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (hash, chunks, vectors) VALUES (?, ?, ?)",
+                (key, json.dumps(texts), matrix.tobytes()),
+            )
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """Delete every entry whose hash is not in ``keep``; returns the number removed."""
+        with self._lock, self._conn:
+            # A temp table rather than NOT IN (?, ...), which is capped by SQLite's variable limit
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_hashes (hash TEXT PRIMARY KEY)")
+            self._conn.executemany("INSERT OR IGNORE INTO keep_hashes (hash) VALUES (?)", ((key,) for key in keep))
+            removed = self._conn.execute(
+                "DELETE FROM embeddings WHERE hash NOT IN (SELECT hash FROM keep_hashes)"
+            ).rowcount
+            self._conn.execute("DELETE FROM keep_hashes")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
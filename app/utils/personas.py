@@ -58,4 +58,8 @@ PERSONAS = {
 
 def get_persona(persona_key="default"):
     """Retrieve a specific persona configuration"""
-    return PERSONAS.get(persona_key, PERSONAS["default"])
\ No newline at end of file
+    return PERSONAS.get(persona_key, PERSONAS["default"])
+
+def get_persona_temperature(persona_key="default", requested=0.7):
+    """Effective sampling temperature: the persona's own value overrides the requested one"""
+    return get_persona(persona_key).get("temperature", requested)
\ No newline at end of file
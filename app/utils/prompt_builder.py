@@ -1,6 +1,21 @@
 # app/utils/prompt_builder.py
 
-from app.utils.personas import get_persona
+from app.utils.personas import PERSONAS, get_persona
+
+# Knowledge context budget (≈500 tokens)
+MAX_CONTEXT_CHARS = 2000
+TRUNCATION_MARKER = "...[truncated]"
+# Longest partial word dropped to end a truncated context on a word boundary
+MAX_WORD_BACKOFF = 40
+
+# Dynamic tail of the knowledge prompt; the static persona prefix comes first so
+# LM Studio can reuse its KV cache for the shared prefix across requests
+_KNOWLEDGE_PROMPT_TAIL = (
+    "COMPANY INFORMATION:\n"
+    "{context}\n\n"
+    "QUESTION: {question}\n\n"
+    "FINAL ANSWER:"
+).format
 
 # Centralized minimal system safeguard / style instructions
 def _build_system_instructions(persona_key: str) -> str:
@@ -24,51 +39,76 @@ def _build_system_instructions(persona_key: str) -> str:
         )
     return base
 
-def build_knowledge_prompt(context, user_question, persona_key="default"):
-    """
-    Build a prompt with knowledge context and specific persona.
-    Optimized for token efficiency.
-    """
+def _knowledge_prompt_prefix(persona_key: str) -> str:
+    """Static, per-persona head of the knowledge prompt."""
     persona = get_persona(persona_key)
     system_instructions = _build_system_instructions(persona_key)
 
     # Use only first 3 traits to save tokens
     traits_str = " ".join(persona["traits"][:3])
 
-    # Truncate context (≈500 tokens)
-    max_context_chars = 2000
-    if len(context) > max_context_chars:
-        context = context[:max_context_chars] + "...[truncated]"
-
-    prompt = (
+    return (
         f"You are {persona['name']}, a {persona['style']}.\n"
         f"PERSONA TRAITS: {traits_str}\n"
         f"SYSTEM INSTRUCTIONS: {system_instructions}\n\n"
         "Answer ONLY using the COMPANY INFORMATION. If the specific answer is not present, say so.\n\n"
-        "COMPANY INFORMATION:\n"
-        f"{context}\n\n"
-        f"QUESTION: {user_question}\n\n"
-        "FINAL ANSWER:"
     )
-    return prompt
 
-def build_regular_chat_prompt(messages, persona_key="default"):
+def _clip(text, limit):
+    """First `limit` characters of text, backed off to a word boundary when one is close."""
+    if len(text) <= limit:
+        return text
+    if text[limit].isspace():
+        return text[:limit].rstrip()
+    head = text[:limit]
+    cut = max(head.rfind(" "), head.rfind("\n"))
+    # Only give back a short partial word; an unbroken run is cut where it stands
+    return head[:cut].rstrip() if cut > 0 and cut >= limit - MAX_WORD_BACKOFF else head
+
+def join_contexts(contexts, max_chars=MAX_CONTEXT_CHARS):
     """
-    Build a system message to prepend to the chat history.
+    Join retrieved chunks with blank lines, stopping at the context budget.
+    A cut ends on a word boundary and the truncation marker counts toward the budget.
+    """
+    budget = max_chars - len(TRUNCATION_MARKER)
+    parts = []
+    total = 0
+    for ctx in contexts:
+        piece = "\n\n" + ctx if parts else ctx
+        if total + len(piece) > max_chars:
+            # Accepted parts may already reach into the marker's share of the budget
+            return _clip("".join(parts) + piece, budget) + TRUNCATION_MARKER
+        parts.append(piece)
+        total += len(piece)
+    return "".join(parts)
+
+def build_knowledge_prompt(context, user_question, persona_key="default"):
+    """
+    Build a prompt with knowledge context and specific persona.
     Optimized for token efficiency.
     """
+    # Truncate context (≈500 tokens); a no-op for output of join_contexts
+    if len(context) > MAX_CONTEXT_CHARS:
+        context = join_contexts([context])
+
+    prefix = _KNOWLEDGE_PREFIXES.get(persona_key, _KNOWLEDGE_PREFIXES["default"])
+    return prefix + _KNOWLEDGE_PROMPT_TAIL(
+        context=context, question=user_question
+    )
+
+def _chat_system_content(persona_key: str) -> str:
     persona = get_persona(persona_key)
-    system_instructions = _build_system_instructions(persona_key)
+    return f"You are {persona['name']}, a {persona['style']}. {_build_system_instructions(persona_key)}"
 
-    system_message = {
-        "role": "system",
-        "content": (
-            f"You are {persona['name']}, a {persona['style']}. "
-            f"{system_instructions}"
-        )
-    }
+# Everything persona-dependent is built once at import; unknown keys fall back to
+# "default" like get_persona does. The system message dicts are shared, never mutate them.
+_KNOWLEDGE_PREFIXES = {key: _knowledge_prompt_prefix(key) for key in PERSONAS}
+_SYSTEM_MESSAGES = {key: {"role": "system", "content": _chat_system_content(key)} for key in PERSONAS}
 
-    # Insert system message at the beginning
-    enhanced_messages = [system_message] + messages
-    
-    return enhanced_messages
\ No newline at end of file
+def build_regular_chat_prompt(messages, persona_key="default"):
+    """
+    Build a system message to prepend to the chat history.
+    Optimized for token efficiency.
+    """
+    system_message = _SYSTEM_MESSAGES.get(persona_key, _SYSTEM_MESSAGES["default"])
+    return [system_message, *messages]
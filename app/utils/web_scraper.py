@@ -1,13 +1,20 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from lxml import etree, html as lxml_html
 import os
 import logging
 import time
+import uuid
 import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Set, List
 from urllib.parse import urlparse, urljoin
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,64 +24,124 @@ class WebsiteScrapeForbidden(Exception):
 
 MAX_TOTAL_BYTES = 250_000  # Limit combined text size (~250 KB)
 MAX_PAGE_BYTES = 120_000   # Per page cap
+CRAWL_WORKERS = 8          # Linked pages fetched concurrently
+# HTML read per page; cleaned text is capped far lower, so bigger pages are cut
+MAX_FETCH_BYTES = 1_000_000
+FETCH_CHUNK_BYTES = 64 * 1024
+WRITE_BUFFER_BYTES = 1 << 20  # Whole aggregated file in one buffer (it is capped at MAX_TOTAL_BYTES)
+# Pages whose cleaned text SimHashes within this many bits of a kept page are skipped
+SIMHASH_MAX_DISTANCE = 3
+SIMHASH_SHINGLE = 5        # Words per shingle
 BOILERPLATE_KEYWORDS = [
     'privacy policy', 'terms of use', 'terms & conditions', 'copyright', 'all rights reserved',
     'cookie policy', 'login', 'sign in', 'create account', 'subscribe', 'newsletter'
 ]
+# Links that never lead to a crawlable page
+_SKIP_HREF = re.compile(r"#|javascript:|mailto:|tel:", re.IGNORECASE)
+_SKIP_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.zip', '.mp4', '.css', '.js')
+# All keywords in one compiled alternation: a single scan per line
+_BOILERPLATE = re.compile("|".join(map(re.escape, BOILERPLATE_KEYWORDS)), re.IGNORECASE)
+
+# Shared keep-alive session so a crawl reuses connections to the same site
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+# Elements whose text never belongs in the knowledge base
+_DROPPED_TAGS = ("script", "style", "noscript", "nav", "footer", "header", "aside")
+
+def _parse_html(html: str):
+    """Parse a page with lxml's C parser; None for an empty document."""
+    try:
+        return lxml_html.fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        return lxml_html.fromstring(html.encode('utf-8'))
+    except etree.ParserError:
+        return None
 
-def _clean_text(html: str) -> str:
-    soup = BeautifulSoup(html, 'html.parser')
-    for element in soup(["script", "style", "noscript"]):
-        element.decompose()
-    # Remove nav/footer elements when identifiable
-    for selector in ["nav", "footer", "header", "aside"]:
-        for el in soup.select(selector):
-            el.decompose()
-    text = soup.get_text(separator='\n')
+def _clean_text(doc) -> str:
+    """Readable text of a parsed page. Mutates doc, so collect its links first."""
+    if doc is None:
+        return ""
+    # Empty the element but keep its tail, the text that follows it in the parent
+    for element in list(doc.iter(*_DROPPED_TAGS)):
+        element.clear(keep_tail=True)
+    text = "\n".join(doc.itertext())
     lines = []
     for line in text.splitlines():
         stripped = line.strip()
         if not stripped:
             continue
-        lower = stripped.lower()
         # Filter boilerplate lines (very short nav items or keyword lines)
-        if any(k in lower for k in BOILERPLATE_KEYWORDS) and len(stripped) < 120:
+        if len(stripped) < 120 and _BOILERPLATE.search(stripped):
             continue
         lines.append(stripped)
     cleaned = "\n\n".join(lines)
-    if len(cleaned.encode('utf-8')) > MAX_PAGE_BYTES:
-        # Truncate softly at paragraph boundaries
-        acc = []
-        total = 0
-        for para in cleaned.split("\n\n"):
-            b = len(para.encode('utf-8')) + 2
-            if total + b > MAX_PAGE_BYTES:
-                break
-            acc.append(para)
-            total += b
-        cleaned = "\n\n".join(acc)
+    # A UTF-8 character is at most 4 bytes, so short pages need no encoding at all
+    if len(cleaned) * 4 <= MAX_PAGE_BYTES:
+        return cleaned
+    encoded = cleaned.encode('utf-8')
+    if len(encoded) > MAX_PAGE_BYTES:
+        # Truncate softly at the last paragraph boundary that fits
+        cut = encoded.rfind(b"\n\n", 0, MAX_PAGE_BYTES)
+        cleaned = encoded[:cut].decode('utf-8') if cut > 0 else ""
     return cleaned
 
+_WHITESPACE = re.compile(r"\s+")
+
 def _hash_dom(html: str) -> str:
-    # Hash without whitespace extremes to detect near duplicates quickly
-    return hashlib.sha256(' '.join(html.split()).encode('utf-8')).hexdigest()
+    # Hash without whitespace extremes to detect near duplicates quickly;
+    # one regex pass instead of a token list plus its joined copy
+    return hashlib.sha256(_WHITESPACE.sub(" ", html).strip().encode('utf-8')).hexdigest()
+
+def _simhash(text: str) -> int:
+    """64-bit SimHash over word shingles; near-identical texts differ in few bits."""
+    tokens = text.split()
+    shingles = [" ".join(tokens[i:i + SIMHASH_SHINGLE]) for i in range(max(1, len(tokens) - SIMHASH_SHINGLE + 1))]
+    digests = b"".join(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest() for s in shingles)
+    # One row of 64 bits per shingle; a fingerprint bit is set when most shingles set it
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 64)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+def _is_near_duplicate(fingerprint: int, seen: List[int]) -> bool:
+    return any(bin(fingerprint ^ other).count('1') <= SIMHASH_MAX_DISTANCE for other in seen)
+
+def _read_capped(resp: requests.Response) -> str:
+    """Decoded body of a streamed response, stopping after MAX_FETCH_BYTES."""
+    parts = []
+    size = 0
+    for block in resp.iter_content(FETCH_CHUNK_BYTES):
+        parts.append(block)
+        size += len(block)
+        if size >= MAX_FETCH_BYTES:
+            logger.info(f"Page larger than {MAX_FETCH_BYTES} bytes; keeping the start of {resp.url}")
+            break
+    body = b"".join(parts)[:MAX_FETCH_BYTES]
+    try:
+        return body.decode(resp.encoding or 'utf-8', errors='replace')
+    except LookupError:
+        # Unknown charset name in the Content-Type header
+        return body.decode('utf-8', errors='replace')
 
 def _fetch(url: str, headers: dict) -> Optional[str]:
     max_attempts = 3
     backoff = 2
     for attempt in range(1, max_attempts + 1):
         try:
-            resp = requests.get(url, headers=headers, timeout=15)
-            if resp.status_code == 403:
-                if attempt == max_attempts:
-                    logger.error(f"Persistent 403 after {attempt} attempts for {url}")
-                    raise WebsiteScrapeForbidden(f"Access forbidden (403) when scraping {url}")
-                logger.warning(f"Attempt {attempt}/3 403 for {url}; retrying in {backoff}s")
-                time.sleep(backoff)
-                backoff *= 2
-                continue
-            resp.raise_for_status()
-            return resp.text
+            with _session.get(url, headers=headers, timeout=15, stream=True) as resp:
+                if resp.status_code == 403:
+                    if attempt == max_attempts:
+                        logger.error(f"Persistent 403 after {attempt} attempts for {url}")
+                        raise WebsiteScrapeForbidden(f"Access forbidden (403) when scraping {url}")
+                    logger.warning(f"Attempt {attempt}/3 403 for {url}; retrying in {backoff}s")
+                    time.sleep(backoff)
+                    backoff *= 2
+                    continue
+                resp.raise_for_status()
+                return _read_capped(resp)
         except WebsiteScrapeForbidden:
             raise
         except requests.RequestException as re:
@@ -122,60 +189,73 @@ def scrape_website(url: str, output_dir: str, depth: int = 1) -> Optional[str]:
         return None
 
     visited_hashes: Set[str] = set()
+    fingerprints: List[int] = []
     aggregated_parts: List[str] = []
     total_bytes = 0
 
-    def consider(html: str, page_url: str):
+    def consider(html: str, page_url: str, doc=None):
         nonlocal total_bytes
         dom_hash = _hash_dom(html)
         if dom_hash in visited_hashes:
             logger.info(f"Skipping duplicate DOM {page_url}")
             return
-        cleaned = _clean_text(html)
+        cleaned = _clean_text(_parse_html(html) if doc is None else doc)
         size = len(cleaned.encode('utf-8'))
         if size == 0:
             return
+        fingerprint = _simhash(cleaned)
+        if _is_near_duplicate(fingerprint, fingerprints):
+            logger.info(f"Skipping near-duplicate content {page_url}")
+            return
         if total_bytes + size > MAX_TOTAL_BYTES:
             logger.info(f"Size cap reached; skipping remaining content at {page_url}")
             return
         visited_hashes.add(dom_hash)
+        fingerprints.append(fingerprint)
         total_bytes += size
         aggregated_parts.append(f"\n\n===== PAGE: {page_url} =====\n\n{cleaned}")
 
-    consider(root_html, url)
-
-    # Crawl same-domain links (depth 1 only)
-    if depth >= 1 and total_bytes < MAX_TOTAL_BYTES:
-        soup = BeautifulSoup(root_html, 'html.parser')
+    # Parse the root page once: links are collected before cleaning drops nav/footer
+    root_doc = _parse_html(root_html)
+    links = set()
+    if depth >= 1 and root_doc is not None:
         root_domain = parsed_url.netloc
-        links = set()
-        for a in soup.find_all('a', href=True):
-            href = a['href'].strip()
-            if href.startswith('#') or href.lower().startswith('javascript:'):
+        for href in root_doc.xpath('//a/@href'):
+            href = href.strip()
+            if not href or _SKIP_HREF.match(href):
                 continue
-            full = urljoin(url, href)
-            parsed_link = urlparse(full)
-            if parsed_link.netloc != root_domain:
+            full = urljoin(url, href).split('#')[0]
+            if urlparse(full).netloc != root_domain:
                 continue
-            # Limit to same scheme and avoid binary assets
-            if any(full.lower().endswith(ext) for ext in ['.pdf', '.jpg', '.png', '.gif', '.svg', '.zip']):
+            # Avoid binary assets
+            if full.lower().endswith(_SKIP_EXTENSIONS):
                 continue
-            links.add(full.split('#')[0])
+            links.add(full)
             if len(links) >= 12:  # small cap
                 break
-        for link in links:
-            if total_bytes >= MAX_TOTAL_BYTES:
-                break
-            html = _fetch(link, headers)
-            if not html:
-                continue
-            consider(html, link)
+
+    consider(root_html, url, root_doc)
+
+    # Crawl same-domain links (depth 1 only)
+    if links and total_bytes < MAX_TOTAL_BYTES:
+        links = list(links)
+        # Fetch linked pages concurrently over the pooled session; pages are still
+        # considered in order so the size cap and de-duplication behave as before
+        with ThreadPoolExecutor(max_workers=min(CRAWL_WORKERS, len(links))) as pool:
+            for link, html in zip(links, pool.map(lambda link: _fetch(link, headers), links)):
+                if total_bytes >= MAX_TOTAL_BYTES:
+                    break
+                if not html:
+                    continue
+                consider(html, link)
 
     # Persist
     os.makedirs(output_dir, exist_ok=True)
     file_path = os.path.join(output_dir, filename)
+    # Write beside the target and swap it in, so a rebuild never reads a partial file
+    part_path = f"{file_path}.{uuid.uuid4().hex}.part"
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
+        with open(part_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_BYTES) as f:
             meta = {
                 'root_url': url,
                 'fetched_at': datetime.utcnow().isoformat() + 'Z',
@@ -183,10 +263,14 @@ def scrape_website(url: str, output_dir: str, depth: int = 1) -> Optional[str]:
                 'total_bytes': total_bytes,
                 'depth': depth,
             }
-            f.write("METADATA::" + str(meta) + "\n\n")
-            f.write('\n'.join(aggregated_parts))
+            f.write("METADATA::" + json.dumps(meta) + "\n\n")
+            # Stream the pages through the file buffer rather than joining them first
+            f.writelines(part if i == 0 else "\n" + part for i, part in enumerate(aggregated_parts))
+        os.replace(part_path, file_path)
     except OSError as oe:
         logger.error(f"Failed writing scraped file {file_path}: {oe}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
         return None
 
     logger.info(f"Successfully scraped and saved {url} to {filename} ({total_bytes} bytes, {len(aggregated_parts)} pages)")
@@ -1,11 +1,16 @@
 import os
 import sys
+import json
 import logging
 from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.utils import embedding_functions
-import pypdf
-import docx2txt
+
+from app.utils.document_processor import (
+    SUPPORTED_EXTENSIONS,
+    chunk_text as app_chunk_text,
+    extract_text as app_extract_text,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -18,93 +23,30 @@ VECTORSTORE_DIR = "./data/vectorstore"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
+MANIFEST_PATH = os.path.join(VECTORSTORE_DIR, "ingest_manifest.json")  # Files already added, for "add missing"
+ADD_BATCH_SIZE = 1000  # Chunks embedded and written per collection.add call
 
 def list_documents(directory):
     """List all documents in the given directory."""
     if not os.path.exists(directory):
         logger.error(f"Directory doesn't exist: {directory}")
-        return []
-        
-    all_files = []
-    for ext in ["*.txt", "*.pdf", "*.docx"]:
-        import glob
-        all_files.extend(glob.glob(os.path.join(directory, ext)))
-    
-    filenames = [os.path.basename(file) for file in all_files]
-    return filenames, all_files
+        return [], []
+
+    # One directory pass, matching extensions case-insensitively like the API
+    with os.scandir(directory) as entries:
+        documents = [
+            (entry.name, entry.path) for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS
+        ]
+    return [name for name, _ in documents], [path for _, path in documents]
 
 def extract_text(file_path):
-    """Extract text from a file."""
-    try:
-        ext = os.path.splitext(file_path)[1].lower()
-        
-        if ext == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        
-        elif ext == '.pdf':
-            text = ""
-            with open(file_path, 'rb') as f:
-                pdf = pypdf.PdfReader(f)
-                for page in pdf.pages:
-                    text += page.extract_text() + "\n"
-            return text
-        
-        elif ext == '.docx':
-            return docx2txt.process(file_path)
-        
-        else:
-            logger.warning(f"Unsupported file type: {ext}")
-            return None
-    
-    except Exception as e:
-        logger.error(f"Error extracting text from {file_path}: {str(e)}")
-        return None
+    """Extract text from a file, exactly as the API does."""
+    return app_extract_text(file_path)
 
 def chunk_text(text, source, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
-    """Split text into chunks with overlap."""
-    chunks = []
-    
-    # Simple chunk by paragraph then by size
-    paragraphs = text.split('\n\n')
-    
-    current_chunk = ""
-    chunk_id = 0
-    
-    for paragraph in paragraphs:
-        # Clean paragraph
-        paragraph = paragraph.strip()
-        if not paragraph:
-            continue
-            
-        if len(current_chunk) + len(paragraph) <= chunk_size:
-            current_chunk += paragraph + "\n\n"
-        else:
-            if current_chunk:
-                chunks.append({
-                    "id": f"{os.path.basename(source)}-{chunk_id}",
-                    "text": current_chunk.strip(), 
-                    "source": source
-                })
-                chunk_id += 1
-                
-                # Create overlap by keeping some content
-                words = current_chunk.split()
-                if len(words) > chunk_overlap:
-                    current_chunk = " ".join(words[-chunk_overlap:]) + "\n\n"
-                else:
-                    current_chunk = ""
-            
-            current_chunk += paragraph + "\n\n"
-    
-    # Add the last chunk
-    if current_chunk:
-        chunks.append({
-            "id": f"{os.path.basename(source)}-{chunk_id}",
-            "text": current_chunk.strip(), 
-            "source": source
-        })
-    
+    """Split text into chunks with overlap, exactly as the API does."""
+    chunks = app_chunk_text(text, source, chunk_size, chunk_overlap)
     logger.info(f"Split document into {len(chunks)} chunks")
     return chunks
 
@@ -175,73 +117,110 @@ def rebuild_collection(client, collection):
         logger.error(f"Error rebuilding collection: {str(e)}")
         return None
 
-def add_document_to_collection(collection, file_path):
-    """Add a single document to the collection."""
+def load_manifest():
+    """Map of ingested file path -> [mtime_ns, size] from the last successful add."""
     try:
-        # Extract text
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+def _file_signature(file_path):
+    st = os.stat(file_path)
+    return [st.st_mtime_ns, st.st_size]
+
+def add_documents_to_collection(collection, file_paths, manifest=None):
+    """Add documents to the collection, embedding their chunks in large batches.
+
+    With a manifest, files whose modification time and size are unchanged since
+    they were last added are skipped, and the manifest is updated in place.
+    """
+    chunks = []
+    added = {}
+    for file_path in file_paths:
+        signature = _file_signature(file_path)
+        if manifest is not None and manifest.get(file_path) == signature:
+            logger.info(f"Unchanged, skipping: {os.path.basename(file_path)}")
+            continue
+        logger.info(f"Adding document: {os.path.basename(file_path)}")
         text = extract_text(file_path)
         if not text:
             logger.warning(f"Could not extract text from {file_path}")
-            return False
-        
-        # Chunk text
-        chunks = chunk_text(text, file_path)
-        if not chunks:
+            continue
+        document_chunks = chunk_text(text, file_path)
+        if not document_chunks:
             logger.warning(f"No chunks created from {file_path}")
-            return False
-        
-        # Prepare data for Chroma
-        ids = [chunk["id"] for chunk in chunks]
-        texts = [chunk["text"] for chunk in chunks]
-        metadatas = [{"source": chunk["source"]} for chunk in chunks]
-        
-        # Add to collection
-        collection.add(
-            ids=ids,
-            documents=texts,
-            metadatas=metadatas
-        )
-        
-        logger.info(f"Added {len(chunks)} chunks from {file_path} to collection")
+            continue
+        chunks.extend(document_chunks)
+        added[file_path] = signature
+
+    # Each add() embeds its documents in one model call, so add many files' chunks at once
+    try:
+        if manifest is not None and added:
+            # Changed files replace the chunks of their previous version
+            collection.delete(where={"source": {"$in": list(added)}})
+        for start in range(0, len(chunks), ADD_BATCH_SIZE):
+            batch = chunks[start:start + ADD_BATCH_SIZE]
+            collection.add(
+                ids=[chunk["id"] for chunk in batch],
+                documents=[chunk["text"] for chunk in batch],
+                metadatas=[{"source": chunk["source"]} for chunk in batch]
+            )
+        logger.info(f"Added {len(chunks)} chunks from {len(added)} documents to collection")
+        if manifest is not None:
+            manifest.update(added)
         return True
     except Exception as e:
-        logger.error(f"Error adding document {file_path}: {str(e)}")
+        logger.error(f"Error adding documents: {str(e)}")
         return False
 
-def query_collection(collection, query_text, k=3):
-    """Query the collection for relevant documents."""
+def query_collection_many(collection, query_texts, k=3):
+    """Query the collection with several queries in one batched call.
+
+    Returns one (documents, sources) pair per query.
+    """
     try:
-        # Query the collection
+        # One call embeds every query in a single model pass and searches them together
         results = collection.query(
-            query_texts=[query_text],
+            query_texts=list(query_texts),
             n_results=k,
-            include_distances=True
+            include=["documents", "metadatas", "distances"]
         )
-        
-        logger.info(f"Query: '{query_text}'")
-        
-        # Check if we have results
-        if results and len(results['documents']) > 0 and len(results['documents'][0]) > 0:
-            documents = results['documents'][0]  # First query result
-            metadatas = results['metadatas'][0]  # First query result
-            distances = results['distances'][0] if 'distances' in results else None
-            
-            # Log results
-            logger.info(f"Query returned {len(documents)} results")
-            
-            if distances:
-                for i, (doc, dist) in enumerate(zip(documents, distances)):
-                    logger.info(f"Result {i+1} (distance={dist:.4f}): {doc[:100]}...")
-                    logger.info(f"  Source: {metadatas[i].get('source', 'Unknown')}")
-            
-            sources = [metadata.get('source', 'Unknown') for metadata in metadatas]
-            return documents, sources
-        else:
-            logger.warning("No results found")
-            return [], []
     except Exception as e:
         logger.error(f"Error querying collection: {str(e)}")
-        return [], []
+        return [([], []) for _ in query_texts]
+
+    answers = []
+    for i, query_text in enumerate(query_texts):
+        logger.info(f"Query: '{query_text}'")
+        documents = results['documents'][i]
+        metadatas = results['metadatas'][i]
+        distances = results['distances'][i] if results.get('distances') else None
+
+        if not documents:
+            logger.warning("No results found")
+            answers.append(([], []))
+            continue
+
+        # Log results
+        logger.info(f"Query returned {len(documents)} results")
+
+        if distances:
+            for j, (doc, dist) in enumerate(zip(documents, distances)):
+                logger.info(f"Result {j+1} (distance={dist:.4f}): {doc[:100]}...")
+                logger.info(f"  Source: {metadatas[j].get('source', 'Unknown')}")
+
+        sources = [metadata.get('source', 'Unknown') for metadata in metadatas]
+        answers.append((documents, sources))
+    return answers
+
+def query_collection(collection, query_text, k=3):
+    """Query the collection for relevant documents."""
+    return query_collection_many(collection, [query_text], k)[0]
 
 def inspect_vectorstore():
     """Inspect the vectorstore directory structure."""
@@ -335,23 +314,21 @@ def main():
         collection = rebuild_collection(client, collection)
         
         if collection:
-            for file_path in file_paths:
-                logger.info(f"Adding document: {os.path.basename(file_path)}")
-                add_document_to_collection(collection, file_path)
+            manifest = {}
+            if add_documents_to_collection(collection, file_paths, manifest):
+                save_manifest(manifest)
             
             logger.info("\n=== Inspecting New Collection ===")
             inspect_chroma_collection(collection)
     
     elif action == "2":
         logger.info("\n=== Adding Missing Documents ===")
+        manifest = load_manifest()
         if collection.count() == 0:
             logger.info("Collection is empty, adding all documents")
-            for file_path in file_paths:
-                add_document_to_collection(collection, file_path)
-        else:
-            # More sophisticated logic could be added here
-            for file_path in file_paths:
-                add_document_to_collection(collection, file_path)
+            manifest = {}
+        if add_documents_to_collection(collection, file_paths, manifest):
+            save_manifest(manifest)
         
         logger.info("\n=== Inspecting Updated Collection ===")
         inspect_chroma_collection(collection)
@@ -369,9 +346,8 @@ def main():
             "What are the special conditions for returns?"
         ]
         
-        for query in test_queries:
+        for query, (documents, sources) in zip(test_queries, query_collection_many(collection, test_queries)):
             logger.info(f"\nTesting query: '{query}'")
-            documents, sources = query_collection(collection, query)
             
             if documents and sources:
                 logger.info(f"Found {len(documents)} matches")
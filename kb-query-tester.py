@@ -1,5 +1,6 @@
 import os
 import logging
+from functools import lru_cache
 import chromadb
 from chromadb.utils import embedding_functions
 from sentence_transformers import SentenceTransformer
@@ -12,61 +13,77 @@ logger = logging.getLogger(__name__)
 VECTORSTORE_DIR = "./data/vectorstore"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
-def load_kb_and_query(query_text):
-    """Load the knowledge base and query it directly."""
+@lru_cache(maxsize=1)
+def _get_collection():
+    """Open the embedding model, Chroma client and collection once for all queries.
+
+    Raises ValueError when the collection does not exist; failures are not cached.
+    """
     logger.info(f"Loading knowledge base from: {VECTORSTORE_DIR}")
-    
+
+    # Set up embedding function
+    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=EMBEDDING_MODEL
+    )
+
+    # Create client
+    client = chromadb.PersistentClient(path=VECTORSTORE_DIR)
+
+    collection = client.get_collection(
+        name="business_knowledge",
+        embedding_function=embedding_function
+    )
+    logger.info(f"Found collection with {collection.count()} documents")
+    return collection
+
+def load_kb_and_query_many(query_texts):
+    """Query the knowledge base directly with several queries in one batched call.
+
+    Returns one (documents, sources) pair per query.
+    """
+    empty = [([], []) for _ in query_texts]
     try:
-        # Set up embedding function
-        embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=EMBEDDING_MODEL
-        )
-        
-        # Create client
-        client = chromadb.PersistentClient(path=VECTORSTORE_DIR)
-        
         # Check if collection exists
         try:
-            collection = client.get_collection(
-                name="business_knowledge",
-                embedding_function=embedding_function
-            )
-            count = collection.count()
-            logger.info(f"Found collection with {count} documents")
+            collection = _get_collection()
         except ValueError as e:
             logger.error(f"Collection not found: {str(e)}")
-            return False
+            return empty
         
-        # Query the collection - without include_distances
-        logger.info(f"Querying with: '{query_text}'")
+        # One call embeds every query in a single model pass and searches them together
+        logger.info(f"Querying with {len(query_texts)} queries")
         results = collection.query(
-            query_texts=[query_text],
+            query_texts=list(query_texts),
             n_results=3
         )
         
-        # Check results
-        if results and 'documents' in results and results['documents'] and results['documents'][0]:
-            documents = results['documents'][0]
-            metadatas = results['metadatas'][0] if 'metadatas' in results and results['metadatas'] else []
-            
-            logger.info(f"Query returned {len(documents)} results")
-            
-            for i, doc in enumerate(documents):
-                logger.info(f"Match {i+1}: {doc[:50]}...")
-                if i < len(metadatas):
-                    source = metadatas[i].get('source', 'Unknown')
+        answers = []
+        for i, query_text in enumerate(query_texts):
+            documents = results['documents'][i] if results.get('documents') else []
+            metadatas = results['metadatas'][i] if results.get('metadatas') else []
+            if not documents:
+                logger.warning(f"No matches found for '{query_text}'")
+                answers.append(([], []))
+                continue
+
+            logger.info(f"Query '{query_text}' returned {len(documents)} results")
+            for j, doc in enumerate(documents):
+                logger.info(f"Match {j+1}: {doc[:50]}...")
+                if j < len(metadatas):
+                    source = metadatas[j].get('source', 'Unknown')
                     logger.info(f"  Source: {os.path.basename(source)}")
             
             sources = [metadata.get('source', 'Unknown') for metadata in metadatas] if metadatas else []
-            return documents, sources
-        else:
-            logger.warning("No matches found in result")
-            logger.info(f"Raw result structure: {results.keys()}")
-            return [], []
+            answers.append((documents, sources))
+        return answers
             
     except Exception as e:
         logger.error(f"Error querying knowledge base: {str(e)}")
-        return [], []
+        return empty
+
+def load_kb_and_query(query_text):
+    """Query the knowledge base directly."""
+    return load_kb_and_query_many([query_text])[0]
 
 def simulate_chat_endpoint():
     """Simulate how the chat endpoint uses the knowledge base."""
@@ -81,9 +98,8 @@ def simulate_chat_endpoint():
         "Tell me about seasonal items returns"
     ]
     
-    for query in test_queries:
+    for query, (documents, sources) in zip(test_queries, load_kb_and_query_many(test_queries)):
         logger.info(f"\nTesting query: '{query}'")
-        documents, sources = load_kb_and_query(query)
         
         if documents and sources:
             logger.info(f"SUCCESS: Found {len(documents)} matching documents")
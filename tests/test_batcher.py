@@ -0,0 +1,56 @@
+import os
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services.batcher import MicroBatcher  # noqa: E402
+
+
+def test_concurrent_calls_share_one_batch():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [i * 2 for i in items]
+
+    batcher = MicroBatcher(double, window_seconds=0.05)
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, batcher.submit(i))) for i in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: i * 2 for i in range(5)}
+    assert len(calls) == 1 and sorted(calls[0]) == list(range(5))
+
+
+def test_errors_reach_every_caller():
+    def fail(items):
+        raise RuntimeError("model unavailable")
+
+    batcher = MicroBatcher(fail, window_seconds=0.001)
+    try:
+        batcher.submit("q")
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert "model unavailable" in str(e)
+
+
+def test_short_result_list_fails_every_caller():
+    def drop_last(items):
+        return list(items)[:-1]
+
+    batcher = MicroBatcher(drop_last, window_seconds=0.05)
+    errors = []
+
+    def call(i):
+        try:
+            batcher.submit(i)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(errors) == 3
@@ -0,0 +1,50 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np  # noqa: E402
+from app.utils.embedding_cache import EmbeddingCache, file_digest  # noqa: E402
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    assert cache.get("missing") is None
+    cache.put("abc", ["one", "two"], [[1.0, 0.0, 0.5], [0.0, 1.0, 0.25]])
+    texts, vectors = cache.get("abc")
+    assert texts == ["one", "two"]
+    assert vectors.shape == (2, 3)
+    assert vectors.dtype == np.float32
+    assert np.allclose(vectors[1], [0.0, 1.0, 0.25])
+
+
+def test_prune_keeps_only_listed_hashes(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    for key in ("a", "b", "c"):
+        cache.put(key, [key], [[1.0, 0.0]])
+    assert cache.prune(["a", "c", "unknown"]) == 1
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.prune([]) == 2
+
+
+def test_entry_without_chunks(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    cache.put("empty", [], [])
+    texts, vectors = cache.get("empty")
+    assert texts == [] and len(vectors) == 0
+
+
+def test_digest_tracks_content_and_salt(tmp_path):
+    path = tmp_path / "doc.txt"
+    path.write_text("hours: 9-5")
+    first = file_digest(str(path), "model-a")
+    assert file_digest(str(path), "model-a") == first
+    assert file_digest(str(path), "model-b") != first
+    path.write_text("hours: 8-4")
+    assert file_digest(str(path), "model-a") != first
+
+
+def test_digest_is_sha256_of_salt_and_content(tmp_path):
+    import hashlib
+    path = tmp_path / "doc.txt"
+    path.write_bytes(b"x" * (3 << 20))
+    assert file_digest(str(path), "salt") == hashlib.sha256(b"salt" + b"x" * (3 << 20)).hexdigest()
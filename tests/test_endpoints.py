@@ -1,4 +1,6 @@
 import os, io, sys, json
+import numpy as np
+import pytest
 from fastapi.testclient import TestClient
 
 # Fast startup & offline stubs
@@ -15,6 +17,19 @@ HDR = {"X-Tenant-Id": TENANT}
 def _p(obj):
     print(json.dumps(obj, indent=2))
 
+@pytest.fixture
+def spy(monkeypatch):
+    """Patch target.name with a wrapper that records each call's (args, kwargs) and delegates."""
+    def install(target, name):
+        calls = []
+        original = getattr(target, name)
+        def wrapper(*args, **kwargs):
+            calls.append((args, kwargs))
+            return original(*args, **kwargs)
+        monkeypatch.setattr(target, name, wrapper)
+        return calls
+    return install
+
 def test_health():
     r = client.get('/health')
     assert r.status_code == 200
@@ -22,6 +37,20 @@ def test_health():
     assert data.get('status') == 'healthy'
 
 
+def test_cors_preflight_and_response_headers():
+    origin = {"Origin": "https://app.example.com"}
+    r = client.options('/api/chat', headers={**origin, "Access-Control-Request-Method": "POST",
+                                             "Access-Control-Request-Headers": "content-type,x-tenant-id"})
+    assert r.status_code == 204
+    assert r.headers['access-control-allow-origin'] == '*'
+    assert r.headers['access-control-allow-headers'] == 'content-type,x-tenant-id'
+    assert 'access-control-allow-credentials' not in r.headers
+    r = client.get('/health', headers=origin)
+    assert r.headers['access-control-allow-origin'] == '*'
+    assert 'access-control-allow-credentials' not in r.headers
+    assert 'access-control-allow-origin' not in client.get('/health').headers
+
+
 def test_completion_offline():
     payload = {"prompt": "Say hi", "use_knowledge_base": False, "tenant_id": TENANT}
     r = client.post('/api/completion', json=payload, headers=HDR)
@@ -29,6 +58,36 @@ def test_completion_offline():
     assert 'OFFLINE' in r.json()['text']
 
 
+
+def test_completion_is_cached_for_opted_in_persona():
+    payload = {"prompt": "What are the opening hours?", "use_knowledge_base": False,
+               "persona": "professional", "tenant_id": TENANT}
+    before = client.get('/debug/cache').json()
+    first = client.post('/api/completion', json=payload, headers=HDR).json()
+    assert client.post('/api/completion', json=payload, headers=HDR).json() == first
+    after = client.get('/debug/cache').json()
+    assert after['hits'] == before['hits'] + 1
+
+def test_chat_cache_is_scoped_to_the_conversation():
+    import app.main as main
+    def chat(history):
+        messages = [*history, {"role": "user", "content": "Tell me more"}]
+        return {"messages": messages, "use_knowledge_base": False, "persona": "professional", "tenant_id": TENANT}
+    first = chat([{"role": "user", "content": "Shipping?"}, {"role": "assistant", "content": "Ships in 2 days."}])
+    other = chat([{"role": "user", "content": "Returns?"}, {"role": "assistant", "content": "30 days."}])
+    before = main.response_cache.hits
+    for payload in (first, other, first):
+        assert client.post('/api/chat', json=payload, headers=HDR).status_code == 200
+    assert main.response_cache.hits == before + 1
+
+def test_completion_no_cache_bypasses_response_cache():
+    payload = {"prompt": "Private question", "use_knowledge_base": False, "persona": "professional",
+               "no_cache": True, "tenant_id": TENANT}
+    before = client.get('/debug/cache').json()
+    for _ in range(2):
+        assert client.post('/api/completion', json=payload, headers=HDR).status_code == 200
+    assert client.get('/debug/cache').json() == before
+
 def test_upload_and_status_cycle():
     # Prepare in-memory text file
     content = b"Return Policy:\nItems can be returned within 30 days."
@@ -45,6 +104,36 @@ def test_upload_and_status_cycle():
     assert any(doc.endswith('policy.txt') for doc in data['documents'])
 
 
+def test_batch_upload():
+    files = [
+        ("files", ("hours.txt", b"Store hours: 9am to 5pm.", 'text/plain')),
+        ("files", ("notes.md", b"Unsupported type", 'text/markdown')),
+    ]
+    r = client.post('/api/knowledge/upload/batch', files=files, data={"tenant_id": TENANT})
+    assert r.status_code == 200
+    data = r.json()
+    assert [res['filename'] for res in data['results']] == ['hours.txt', 'notes.md']
+    assert data['results'][1]['status'] == 'warning'
+    assert data['status'] == 'warning'
+    for name in ('hours.txt', 'notes.md'):
+        client.delete(f'/api/knowledge/documents/{name}', headers=HDR)
+
+
+def test_batch_upload_reports_duplicate_filenames():
+    files = [
+        ("files", ("dup.txt", b"First copy.", 'text/plain')),
+        ("files", ("dup.txt", b"Second copy.", 'text/plain')),
+    ]
+    r = client.post('/api/knowledge/upload/batch', files=files, data={"tenant_id": TENANT})
+    assert r.status_code == 200
+    data = r.json()
+    assert [res['status'] for res in data['results']] == ['success', 'error']
+    assert data['status'] == 'warning'
+    r = client.get('/debug/knowledge', params={"query": "First copy."}, headers=HDR)
+    assert any('First copy.' in c for c in r.json()['contexts'])
+    client.delete('/api/knowledge/documents/dup.txt', headers=HDR)
+
+
 def test_debug_query():
     r = client.get('/debug/knowledge', params={'query': 'return'}, headers=HDR)
     assert r.status_code == 200
@@ -57,6 +146,31 @@ def test_chat_offline():
     assert 'message' in r.json()
 
 
+def test_chat_stream_offline():
+    payload = {"messages": [{"role": "user", "content": "Hello"}], "use_knowledge_base": False, "tenant_id": TENANT}
+    r = client.post('/api/chat/stream', json=payload, headers=HDR)
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/event-stream')
+    assert r.text.startswith('event: sources')
+    assert 'OFFLINE' in r.text and r.text.endswith('data: [DONE]\n\n')
+
+
+def test_chat_without_user_turn_or_content():
+    r = client.post('/api/chat', json={"messages": [{"role": "system", "content": "Be brief"}]}, headers=HDR)
+    assert r.status_code == 400
+    r = client.post('/api/chat', json={"messages": [{"role": "user", "content": "  "}]}, headers=HDR)
+    assert r.status_code == 200
+    assert r.json()['message']['content'] == ''
+
+
+def test_sse_text_only_accepts_complete_streams():
+    from app.main import _sse_text
+    frames = b'data: {"choices":[{"delta":{"content":"Hel"}}]}\n\ndata: {"choices":[{"delta":{"content":"lo"}}]}\n\n'
+    assert _sse_text(frames + b'data: [DONE]\n\n') == 'Hello'
+    assert _sse_text(frames) is None
+    assert _sse_text(b'data: {"error":"LM Studio API error 500"}\n\ndata: [DONE]\n\n') is None
+
+
 def test_rebuild():
     r = client.post('/api/knowledge/rebuild', headers=HDR)
     assert r.status_code == 200
@@ -68,6 +182,290 @@ def test_delete_document():
     # Accept 200 (deleted) or 404 (already gone)
     assert r.status_code in (200, 404)
 
+
+def test_delete_removes_only_that_documents_vectors():
+    files = {"file": ("refunds.txt", b"Refunds are issued within 5 business days.", 'text/plain')}
+    client.post('/api/knowledge/upload', files=files, headers=HDR)
+    before = client.get('/api/knowledge/status', headers=HDR).json()['vector_count']
+    r = client.delete('/api/knowledge/documents/refunds.txt', headers=HDR)
+    assert r.status_code == 200
+    assert client.get('/api/knowledge/status', headers=HDR).json()['vector_count'] == before - 1
+
+
+def test_reupload_replaces_previous_vectors():
+    files = {"file": ("faq.txt", b"Old answer.", 'text/plain')}
+    client.post('/api/knowledge/upload', files=files, headers=HDR)
+    before = client.get('/api/knowledge/status', headers=HDR).json()['vector_count']
+    files = {"file": ("faq.txt", b"New answer.", 'text/plain')}
+    client.post('/api/knowledge/upload', files=files, headers=HDR)
+    assert client.get('/api/knowledge/status', headers=HDR).json()['vector_count'] == before
+    r = client.get('/debug/knowledge', params={"query": "New answer."}, headers=HDR)
+    assert any('New answer.' in c for c in r.json()['contexts'])
+    assert not any('Old answer.' in c for c in r.json()['contexts'])
+    client.delete('/api/knowledge/documents/faq.txt', headers=HDR)
+
+def test_add_chunks_writes_in_batches():
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    source = os.path.join(kb.documents_dir, 'batched.txt')
+    chunks = [{"id": f"batched.txt-{i}", "text": f"chunk {i}", "source": source} for i in range(7)]
+    before = kb.collection.count()
+    vectors = np.asarray(kb.embedding_function([c["text"] for c in chunks]), dtype=np.float32)
+    kb._add_chunks(chunks, vectors, batch_size=3)
+    assert kb.collection.count() == before + 7
+    assert kb.remove_document(source)
+
+
+def test_add_documents_parses_in_worker_processes():
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    paths = []
+    for name in ('proc_a.txt', 'proc_b.txt'):
+        path = os.path.join(kb.documents_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"{name} paragraph one.\n\n{name} paragraph two.")
+        paths.append(path)
+    assert kb.add_documents(paths, parse_workers=2) == {p: True for p in paths}
+    found = kb.collection.get(where={"source": {"$in": paths}})
+    assert sorted({m['name'] for m in found['metadatas']}) == ['proc_a.txt', 'proc_b.txt']
+    for path in paths:
+        assert kb.remove_document(path)
+        os.remove(path)
+
+
+def test_hash_embedding_is_deterministic_and_unit_length():
+    from app.services.knowledge_service import _hash_embed, HASH_EMBEDDING_DIM
+    vectors = np.asarray(_hash_embed(["alpha", "beta", "alpha"]))
+    assert vectors.shape == (3, HASH_EMBEDDING_DIM)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.array_equal(vectors[0], vectors[2])
+    assert not np.array_equal(vectors[0], vectors[1])
+    assert _hash_embed([]) == []
+
+
+def test_tenants_share_one_embedding_function():
+    from app.services.knowledge_service import get_knowledge_base
+    assert get_knowledge_base("share_a").embedding_function is get_knowledge_base("share_b").embedding_function
+
+
+def test_chunk_text_overlaps_by_characters():
+    from app.utils.document_processor import chunk_text
+    text = "alpha beta\n\n\n  gamma delta  \n\n \n\nepsilon zeta eta theta"
+    chunks = chunk_text(text, "/docs/a.txt", chunk_size=30, chunk_overlap=5)
+    assert [c["id"] for c in chunks] == ["a.txt-0", "a.txt-1"]
+    assert chunks[0]["text"] == "alpha beta\n\n\n  gamma delta"
+    assert chunks[1]["text"].startswith("delta")
+    assert chunks[1]["text"].endswith("epsilon zeta eta theta")
+    assert chunk_text(" \n\n ", "/docs/b.txt", 30, 5) == []
+
+
+def _minimal_pdf(lines):
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for line in lines:
+        stream = b"BT /F1 12 Tf 72 720 Td (" + line.encode() + b") Tj ET"
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                    b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objs))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids)
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+def test_extract_pdf_text(tmp_path):
+    from app.utils.document_processor import extract_text
+    path = tmp_path / "two_pages.pdf"
+    path.write_bytes(_minimal_pdf(["Hello page one", "Second page text"]))
+    assert extract_text(str(path)) == "Hello page one\nSecond page text\n"
+
+
+def test_extract_pdf_text_falls_back_to_pypdf(tmp_path, monkeypatch):
+    import pypdfium2
+    from app.utils.document_processor import extract_text
+    def refuse(*args, **kwargs):
+        raise pypdfium2.PdfiumError("Failed to load document")
+    monkeypatch.setattr(pypdfium2, "PdfDocument", refuse)
+    path = tmp_path / "fallback.pdf"
+    path.write_bytes(_minimal_pdf(["Read by pypdf"]))
+    assert extract_text(str(path)).strip() == "Read by pypdf"
+
+
+def test_rebuild_keeps_unchanged_and_drops_removed_documents(monkeypatch, spy):
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    client.post('/api/knowledge/upload', files={"file": ("keep.txt", b"Kept content.", 'text/plain')}, headers=HDR)
+    client.post('/api/knowledge/upload', files={"file": ("gone.txt", b"Gone content.", 'text/plain')}, headers=HDR)
+    keep, gone = (os.path.join(kb.documents_dir, n) for n in ('keep.txt', 'gone.txt'))
+    os.remove(gone)
+    writes = spy(type(kb.collection), 'upsert')
+    assert client.post('/api/knowledge/rebuild', headers=HDR).status_code == 200
+    monkeypatch.undo()
+    assert not any(i.startswith('keep.txt-') for _, kw in writes for i in kw['ids'])
+    assert kb.collection.get(where={"source": gone})['ids'] == []
+    assert kb.collection.get(where={"source": keep})['ids']
+    client.delete('/api/knowledge/documents/keep.txt', headers=HDR)
+
+
+def test_reupload_with_fewer_chunks_drops_leftover_ids():
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    long_text = ("a" * 600 + "\n\n" + "b" * 600).encode()
+    client.post('/api/knowledge/upload', files={"file": ("shrink.txt", long_text, 'text/plain')}, headers=HDR)
+    source = os.path.join(kb.documents_dir, 'shrink.txt')
+    assert sorted(kb.collection.get(where={"source": source})['ids']) == ['shrink.txt-0', 'shrink.txt-1']
+    client.post('/api/knowledge/upload', files={"file": ("shrink.txt", b"short", 'text/plain')}, headers=HDR)
+    stored = kb.collection.get(where={"source": source})
+    assert stored['ids'] == ['shrink.txt-0'] and stored['documents'] == ['short']
+    client.delete('/api/knowledge/documents/shrink.txt', headers=HDR)
+
+
+def test_concurrent_searches_get_their_own_results():
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    for name, body in (("apples.txt", b"Apples are red."), ("pears.txt", b"Pears are green.")):
+        client.post('/api/knowledge/upload', files={"file": (name, body, 'text/plain')}, headers=HDR)
+    # Hash embeddings only match the exact stored text
+    texts = ["Apples are red.", "Pears are green."]
+    vectors = dict(zip(texts, kb.embedding_function(texts)))
+    with ThreadPoolExecutor(4) as pool:
+        found = list(pool.map(lambda t: kb.query_by_vector(vectors[t], k=1 if t.startswith("A") else 2),
+                              list(vectors) * 2))
+    assert [docs[0] for docs, _ in found] == list(vectors) * 2
+    assert [len(docs) for docs, _ in found] == [1, 2, 1, 2]
+    for name in ("apples.txt", "pears.txt"):
+        client.delete(f'/api/knowledge/documents/{name}', headers=HDR)
+
+
+def test_identical_chunks_are_embedded_once(spy, tmp_path):
+    from app.services.knowledge_service import KnowledgeBase
+    # A fresh store: the shared tenant's embedding cache already holds these vectors after one run
+    kb = KnowledgeBase(TENANT, base_documents_dir=str(tmp_path / "documents"),
+                       base_vectorstore_dir=str(tmp_path / "vectorstore"))
+    paths = []
+    for name in ('boiler_a.txt', 'boiler_b.txt'):
+        path = os.path.join(kb.documents_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Shared boilerplate {TENANT}.")
+        paths.append(path)
+    calls = spy(kb, 'embedding_function')
+    assert all(kb.add_documents(paths).values())
+    assert [list(args[0]) for args, _ in calls] == [[f"Shared boilerplate {TENANT}."]]
+    assert len(kb.collection.get(where={"source": {"$in": paths}})['ids']) == 2
+    kb.close()
+
+
+def test_removed_and_edited_documents_leave_the_embedding_cache(tmp_path):
+    from app.services.knowledge_service import KnowledgeBase
+    kb = KnowledgeBase(TENANT, base_documents_dir=str(tmp_path / "documents"),
+                       base_vectorstore_dir=str(tmp_path / "vectorstore"))
+    keep, edited = (os.path.join(kb.documents_dir, n) for n in ('kept.txt', 'edited.txt'))
+    for path in (keep, edited):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"First version of {os.path.basename(path)}.")
+    assert all(kb.add_documents([keep, edited]).values())
+    def count():
+        return kb.embedding_cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    assert count() == 2
+    with open(edited, 'w', encoding='utf-8') as f:
+        f.write("Second version.")
+    assert kb.rebuild_knowledge_base()
+    assert count() == 2
+    assert kb.remove_document(edited)
+    assert count() == 1
+    kb.close()
+
+
+def test_repeated_query_results_are_cached_until_next_write(spy):
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    client.post('/api/knowledge/upload', files={"file": ("cached.txt", b"Cached fact.", 'text/plain')}, headers=HDR)
+    searches = spy(kb, 'query_by_vector')
+    first = kb.query("What is  the cached fact?")
+    assert kb.query("what is the cached FACT?") == first
+    assert len(searches) == 1
+    client.delete('/api/knowledge/documents/cached.txt', headers=HDR)
+    kb.query("What is the cached fact?")
+    assert len(searches) == 2
+
+
+def test_cached_query_results_expire(monkeypatch, spy):
+    import app.services.knowledge_service as knowledge_service
+    kb = knowledge_service.get_knowledge_base(TENANT)
+    client.post('/api/knowledge/upload', files={"file": ("expiring.txt", b"Expiring fact.", 'text/plain')}, headers=HDR)
+    searches = spy(kb, 'query_by_vector')
+    # Another worker may have written since; an expired entry is searched again
+    monkeypatch.setattr(knowledge_service, 'QUERY_RESULT_CACHE_TTL', -1)
+    kb.query("Expiring fact.")
+    kb.query("Expiring fact.")
+    assert len(searches) == 2
+    client.delete('/api/knowledge/documents/expiring.txt', headers=HDR)
+
+
+def test_truncated_context_ends_on_a_word_boundary():
+    from app.utils.prompt_builder import join_contexts, MAX_CONTEXT_CHARS, TRUNCATION_MARKER
+    context = join_contexts(["alpha beta gamma " * 200])
+    assert len(context) <= MAX_CONTEXT_CHARS
+    body = context[:-len(TRUNCATION_MARKER)]
+    assert context.endswith(TRUNCATION_MARKER)
+    assert body.split()[-1] in {"alpha", "beta", "gamma"}
+
+
+def test_joined_contexts_near_the_limit_stay_within_budget():
+    from app.utils.prompt_builder import join_contexts, MAX_CONTEXT_CHARS, TRUNCATION_MARKER
+    for first in (MAX_CONTEXT_CHARS - 5, MAX_CONTEXT_CHARS - len(TRUNCATION_MARKER), MAX_CONTEXT_CHARS - 150):
+        context = join_contexts(["a" * first, "b" * 100, "c" * 100])
+        assert len(context) <= MAX_CONTEXT_CHARS
+        assert context.endswith(TRUNCATION_MARKER)
+    fitting = ["a" * 990, "b" * 1000]
+    assert join_contexts(fitting) == "\n\n".join(fitting)
+
+
+def test_list_documents_matches_extensions_case_insensitively(tmp_path):
+    from app.utils.document_processor import list_documents
+    for name in ("a.txt", "B.PDF", "c.Docx", "notes.md"):
+        (tmp_path / name).write_text("x")
+    (tmp_path / "dir.txt").mkdir()
+    assert sorted(list_documents(str(tmp_path))) == ["B.PDF", "a.txt", "c.Docx"]
+    assert list_documents(str(tmp_path / "missing")) == []
+
+
+def test_vector_count_is_cached_until_next_write(spy):
+    from chromadb.api.models.Collection import Collection
+    from app.services.knowledge_service import get_knowledge_base
+    kb = get_knowledge_base(TENANT)
+    client.post('/api/knowledge/upload', files={"file": ("counted.txt", b"Counted fact.", 'text/plain')}, headers=HDR)
+    counts = spy(Collection, 'count')
+    before = kb.vector_count()
+    assert before > 0 and kb.vector_count() == before
+    assert len(counts) == 1
+    client.delete('/api/knowledge/documents/counted.txt', headers=HDR)
+    assert kb.vector_count() < before
+    assert len(counts) == 2
+
+
+def test_vector_count_is_recounted_after_ttl(monkeypatch, spy):
+    from chromadb.api.models.Collection import Collection
+    import app.services.knowledge_service as knowledge_service
+    kb = knowledge_service.get_knowledge_base(TENANT)
+    client.post('/api/knowledge/upload', files={"file": ("recounted.txt", b"Recounted fact.", 'text/plain')}, headers=HDR)
+    counts = spy(Collection, 'count')
+    monkeypatch.setattr(knowledge_service, 'QUERY_RESULT_CACHE_TTL', -1)
+    kb.vector_count()
+    kb.vector_count()
+    assert len(counts) == 2
+    monkeypatch.undo()
+    client.delete('/api/knowledge/documents/recounted.txt', headers=HDR)
+
 if __name__ == '__main__':
     for name, fn in list(globals().items()):
         if name.startswith('test_') and callable(fn):
@@ -2,10 +2,12 @@ import os
 import json
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import pytest
 from fastapi.testclient import TestClient
 
-# Ensure fast startup (hash embeddings) for tests
+# Ensure fast startup (hash embeddings) and stubbed LM Studio replies for tests
 os.environ.setdefault("FAST_START", "1")
+os.environ.setdefault("OFFLINE_MODE", "1")
 
 from app.main import app  # noqa: E402
 
@@ -13,6 +15,13 @@ client = TestClient(app)
 
 TENANT_HEADER = {"X-Tenant-Id": "default"}
 
+DEBUG_QUERIES = [
+    "What is the return policy?",
+    "How long do I have to return items?",
+    "Can I return electronics?",
+    "What are the special conditions for returns?"
+]
+
 def pretty(obj):
     return json.dumps(obj, indent=2)
 
@@ -23,18 +32,20 @@ def test_knowledge_status():
     print("Status:", pretty(data))
     assert "document_count" in data
 
-def test_debug_queries():
-    queries = [
-        "What is the return policy?",
-        "How long do I have to return items?",
-        "Can I return electronics?",
-        "What are the special conditions for returns?"
-    ]
-    for q in queries:
-        r = client.get("/debug/knowledge", params={"query": q}, headers=TENANT_HEADER)
-        assert r.status_code == 200
-        payload = r.json()
-        print(f"Query '{q}' found_matches={payload['found_matches']}")
+@pytest.mark.parametrize("query", DEBUG_QUERIES)
+def test_debug_queries(query):
+    r = client.get("/debug/knowledge", params={"query": query}, headers=TENANT_HEADER)
+    assert r.status_code == 200
+    payload = r.json()
+    print(f"Query '{query}' found_matches={payload['found_matches']}")
+
+def test_debug_queries_batch():
+    r = client.post("/debug/knowledge/batch", json={"queries": DEBUG_QUERIES}, headers=TENANT_HEADER)
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert [res["query"] for res in results] == DEBUG_QUERIES
+    for res in results:
+        print(f"Query '{res['query']}' found_matches={res['found_matches']}")
 
 def test_chat_with_kb():
     chat_payload = {
@@ -53,6 +64,8 @@ def test_chat_with_kb():
 if __name__ == "__main__":
     # Run ad-hoc if executed directly
     test_knowledge_status()
-    test_debug_queries()
+    for q in DEBUG_QUERIES:
+        test_debug_queries(q)
+    test_debug_queries_batch()
     test_chat_with_kb()
     print("All ad-hoc tests completed")
\ No newline at end of file
@@ -0,0 +1,23 @@
+import asyncio
+import os
+import sys
+import httpx
+import pytest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("FAST_START", "1")
+from app.models import ChatMessage  # noqa: E402
+from app.services.llm_service import LLMService, LMStudioError, ERROR_BODY_LIMIT  # noqa: E402
+
+
+def test_error_body_is_truncated():
+    service = LLMService()
+    service.offline = False
+    service.client = httpx.AsyncClient(
+        base_url="http://lmstudio.test/v1",
+        transport=httpx.MockTransport(lambda request: httpx.Response(500, content=b"x" * 100_000)),
+    )
+    messages = [ChatMessage(role="user", content="hello")]
+    with pytest.raises(LMStudioError) as exc:
+        asyncio.run(service.generate_chat_completion(messages, use_knowledge_base=False))
+    assert exc.value.status_code == 500
+    assert len(exc.value.body) == ERROR_BODY_LIMIT
@@ -0,0 +1,43 @@
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.services.semantic_cache import SemanticCache  # noqa: E402
+
+NS = ("chat", "default", "default", True)
+
+
+def test_similar_prompt_hits():
+    cache = SemanticCache(threshold=0.9)
+    cache.store(NS, [1.0, 0.0, 0.0], "answer", ["policy.txt"])
+    assert cache.lookup(NS, [0.99, 0.05, 0.0]) == ("answer", ["policy.txt"])
+    assert cache.stats()["hits"] == 1
+
+
+def test_dissimilar_or_other_namespace_misses():
+    cache = SemanticCache(threshold=0.9)
+    cache.store(NS, [1.0, 0.0, 0.0], "answer", None)
+    assert cache.lookup(NS, [0.0, 1.0, 0.0]) is None
+    assert cache.lookup(("chat", "acme", "default", True), [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_expired_and_evicted_entries_miss():
+    cache = SemanticCache(threshold=0.9, ttl_seconds=-1)
+    cache.store(NS, [1.0, 0.0], "stale", None)
+    assert cache.lookup(NS, [1.0, 0.0]) is None
+
+    cache = SemanticCache(threshold=0.9, max_entries=1)
+    cache.store(NS, [1.0, 0.0], "first", None)
+    cache.store(NS, [0.0, 1.0], "second", None)
+    assert cache.lookup(NS, [1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_invalidate_drops_matching_namespaces():
+    cache = SemanticCache(threshold=0.9)
+    other = ("chat", "default", "default", False)
+    cache.store(NS, [1.0, 0.0], "kb answer", ["policy.txt"])
+    cache.store(other, [1.0, 0.0], "plain answer", None)
+    assert cache.invalidate(lambda key: key[1] == "default" and key[3]) == 1
+    assert cache.lookup(NS, [1.0, 0.0]) is None
+    assert cache.lookup(other, [1.0, 0.0]) == ("plain answer", None)
@@ -0,0 +1,53 @@
+import json
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.utils import web_scraper  # noqa: E402
+
+PAGES = {
+    "https://example.com/": (
+        '<html><body><nav><a href="/about">About</a></nav>'
+        '<p>Welcome to <b>Example</b> Corp</p><script>var x = 1;</script>'
+        'We build cabinets.<footer>Copyright 2024</footer></body></html>'
+    ),
+    "https://example.com/about": "<html><body><p>Founded in 1990.</p></body></html>",
+}
+
+
+def test_scrape_website_cleans_text_and_follows_nav_links(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_scraper, "_fetch", lambda url, headers: PAGES.get(url))
+    path = web_scraper.scrape_website("https://example.com/", str(tmp_path))
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    header, _ = text.split("\n\n", 1)
+    assert header.startswith("METADATA::")
+    assert json.loads(header[len("METADATA::"):])["pages"] == 2
+    assert "Welcome to\n\nExample\n\nCorp" in text
+    assert "We build cabinets." in text
+    assert "Founded in 1990." in text
+    for dropped in ("var x", "Copyright", "About"):
+        assert dropped not in text
+
+
+def test_scrape_website_skips_near_duplicate_pages(tmp_path, monkeypatch):
+    body = " ".join(f"Section {i} covers cabinet storage rules for site {i % 7}." for i in range(60))
+    pages = {
+        "https://example.com/": f'<html><body><a href="/copy">Copy</a><p>{body} Updated 2024-05-01.</p></body></html>',
+        "https://example.com/copy": f"<html><body><p>{body} Updated 2024-06-12.</p></body></html>",
+    }
+    monkeypatch.setattr(web_scraper, "_fetch", lambda url, headers: pages.get(url))
+    path = web_scraper.scrape_website("https://example.com/", str(tmp_path))
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    assert "2024-05-01" in text
+    assert "2024-06-12" not in text
+
+
+def test_read_capped_stops_at_fetch_limit(monkeypatch):
+    import io
+    import requests
+    monkeypatch.setattr(web_scraper, "MAX_FETCH_BYTES", 100)
+    resp = requests.Response()
+    resp.raw = io.BytesIO("é".encode("utf-8") * 1000)
+    resp.encoding = "utf-8"
+    assert web_scraper._read_capped(resp) == "é" * 50